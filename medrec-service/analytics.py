@@ -1,32 +1,126 @@
+from collections import deque
 from datetime import datetime
+import time
 import numpy as np
 
+SESSION_COLUMNS = (
+    ('timestamp', np.float64),
+    ('qber', np.float64),
+    ('fidelity', np.float64),
+    ('sifted_length', np.int64),
+    ('eve_active', np.bool_)
+)
+SEVERITIES = ('CRITICAL', 'WARNING')
+
+class SessionRing:
+    # Fixed-capacity columnar ring buffer: appends overwrite the oldest slot, reads copy only the tail asked for
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in SESSION_COLUMNS}
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, **values):
+        for name, column in self.columns.items():
+            column[self._next] = values[name]
+        self._next = (self._next + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def tail(self, name, n):
+        n = min(n, self._count)
+        column = self.columns[name]
+        start = self._next - n
+        if start >= 0:
+            return column[start:self._next].copy()
+        return np.concatenate((column[start:], column[:self._next]))
+
+class RunningStats:
+    # Welford's online mean/variance plus an EWMA, all updated in O(1) per sample
+    __slots__ = ('count', 'mean', '_m2', 'ewma', 'alpha', 'min', 'max')
+
+    def __init__(self, alpha=0.1):
+        self.alpha = alpha
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.ewma = None
+        self.min = None
+        self.max = None
+
+    def update(self, value):
+        value = float(value)
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        self.ewma = value if self.ewma is None else self.ewma + self.alpha * (value - self.ewma)
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    @property
+    def variance(self):
+        return self._m2 / self.count if self.count else 0.0
+
+    @property
+    def std(self):
+        return self.variance ** 0.5
+
+    def export_state(self):
+        return [self.count, self.mean, self._m2, self.ewma, self.min, self.max]
+
+    def load_state(self, exported):
+        self.count, self.mean, self._m2, self.ewma, self.min, self.max = exported
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'mean': round(self.mean, 4),
+            'std': round(self.std, 4),
+            'ewma': round(self.ewma, 4) if self.ewma is not None else None,
+            'min': self.min,
+            'max': self.max
+        }
+
 class SecurityAnalytics:
-    def __init__(self):
-        self.qber_history = []
-        self.fidelity_history = []
-        self.threat_events = []
+    def __init__(self, capacity=50, threat_capacity=100, ewma_alpha=0.1, timeseries=None):
+        self.sessions = SessionRing(capacity)
+        # Optional MetricsTimeSeries that keeps every session beyond the in-memory ring
+        self.timeseries = timeseries
+        self.qber_stats = RunningStats(ewma_alpha)
+        self.fidelity_stats = RunningStats(ewma_alpha)
+        self.threat_events = deque(maxlen=threat_capacity)
+        # Severity counts over the retained threats, kept in step with the deque on insert/evict
+        self.threat_counts = dict.fromkeys(SEVERITIES, 0)
+        self.threats_recorded = 0
         self.key_generation_count = 0
-        
+
     def record_qkd_session(self, metrics, eve_active=False):
-        timestamp = datetime.now().isoformat()
-        
+        now = time.time()
+
         session_data = {
-            'timestamp': timestamp,
+            'timestamp': datetime.fromtimestamp(now).isoformat(),
             'qber': metrics['qber'],
             'fidelity': metrics['fidelity'],
             'sifted_length': metrics['sifted_key_length'],
             'eve_active': eve_active
         }
-        
-        self.qber_history.append(session_data)
-        self.fidelity_history.append(session_data)
+
+        self.sessions.append(
+            timestamp=now,
+            qber=metrics['qber'],
+            fidelity=metrics['fidelity'],
+            sifted_length=metrics['sifted_key_length'],
+            eve_active=eve_active
+        )
+        if self.timeseries is not None:
+            self.timeseries.record(now, metrics['qber'], metrics['fidelity'], metrics['sifted_key_length'], eve_active)
+        self.qber_stats.update(metrics['qber'])
+        self.fidelity_stats.update(metrics['fidelity'])
         self.key_generation_count += 1
-        
-        if len(self.qber_history) > 50:
-            self.qber_history.pop(0)
-            self.fidelity_history.pop(0)
-        
+
         if metrics['qber'] > 11:
             self.record_threat({
                 'type': 'HIGH_QBER',
@@ -41,65 +135,102 @@ class SecurityAnalytics:
                 'qber': metrics['qber'],
                 'message': f"Elevated QBER detected: {metrics['qber']:.2f}%"
             })
-        
+
         return session_data
-    
+
     def record_threat(self, threat_data):
         threat_data['timestamp'] = datetime.now().isoformat()
+
+        if len(self.threat_events) == self.threat_events.maxlen:
+            evicted = self.threat_events[0].get('severity')
+            if evicted in self.threat_counts:
+                self.threat_counts[evicted] -= 1
+
         self.threat_events.append(threat_data)
-        
-        if len(self.threat_events) > 100:
-            self.threat_events.pop(0)
-    
+        severity = threat_data.get('severity')
+        if severity in self.threat_counts:
+            self.threat_counts[severity] += 1
+        self.threats_recorded += 1
+
+    def export_state(self):
+        # JSON-safe copy for a shared state backend, oldest session first
+        return {
+            'sessions': {name: self.sessions.tail(name, len(self.sessions)).tolist() for name, _ in SESSION_COLUMNS},
+            'qber_stats': self.qber_stats.export_state(),
+            'fidelity_stats': self.fidelity_stats.export_state(),
+            'threats': list(self.threat_events),
+            'threats_recorded': self.threats_recorded,
+            'key_generation_count': self.key_generation_count
+        }
+
+    def load_state(self, exported):
+        # Replaces everything with a copy exported by another process; the timeseries is
+        # already shared on disk, so nothing is re-recorded there
+        sessions = SessionRing(self.sessions.capacity)
+        columns = exported['sessions']
+        for row in zip(*(columns[name] for name, _ in SESSION_COLUMNS)):
+            sessions.append(**dict(zip((name for name, _ in SESSION_COLUMNS), row)))
+        threat_events = deque(exported['threats'], maxlen=self.threat_events.maxlen)
+        threat_counts = dict.fromkeys(SEVERITIES, 0)
+        for threat in threat_events:
+            if threat.get('severity') in threat_counts:
+                threat_counts[threat['severity']] += 1
+
+        self.sessions = sessions
+        self.qber_stats.load_state(exported['qber_stats'])
+        self.fidelity_stats.load_state(exported['fidelity_stats'])
+        self.threat_events, self.threat_counts = threat_events, threat_counts
+        self.threats_recorded = exported['threats_recorded']
+        self.key_generation_count = exported['key_generation_count']
+
     def get_average_qber(self, last_n=10):
-        if not self.qber_history:
+        if not len(self.sessions):
             return 0
-        
-        recent = self.qber_history[-last_n:]
-        return np.mean([s['qber'] for s in recent])
-    
+
+        return float(self.sessions.tail('qber', last_n).mean())
+
     def get_average_fidelity(self, last_n=10):
-        if not self.fidelity_history:
+        if not len(self.sessions):
             return 0
-        
-        recent = self.fidelity_history[-last_n:]
-        return np.mean([s['fidelity'] for s in recent])
-    
+
+        return float(self.sessions.tail('fidelity', last_n).mean())
+
     def detect_anomalies(self, current_qber):
-        if len(self.qber_history) < 5:
+        if len(self.sessions) < 5:
             return False
-        
-        recent_qbers = [s['qber'] for s in self.qber_history[-10:]]
-        mean = np.mean(recent_qbers)
-        std = np.std(recent_qbers)
-        
-        return current_qber > mean + 2 * std
-    
+
+        recent_qbers = self.sessions.tail('qber', 10)
+        return current_qber > recent_qbers.mean() + 2 * recent_qbers.std()
+
     def get_threat_summary(self):
-        if not self.threat_events:
-            return {
-                'total_threats': 0,
-                'critical': 0,
-                'warning': 0,
-                'recent': []
-            }
-        
-        critical = sum(1 for t in self.threat_events if t.get('severity') == 'CRITICAL')
-        warning = sum(1 for t in self.threat_events if t.get('severity') == 'WARNING')
-        
         return {
             'total_threats': len(self.threat_events),
-            'critical': critical,
-            'warning': warning,
-            'recent': self.threat_events[-5:]
+            'critical': self.threat_counts['CRITICAL'],
+            'warning': self.threat_counts['WARNING'],
+            'recent': [self.threat_events[i] for i in range(-min(5, len(self.threat_events)), 0)]
         }
-    
+
+    def get_history(self, last_n=20):
+        columns = {name: self.sessions.tail(name, last_n) for name, _ in SESSION_COLUMNS}
+        return [{
+            'timestamp': datetime.fromtimestamp(timestamp).isoformat(),
+            'qber': float(qber),
+            'fidelity': float(fidelity),
+            'sifted_length': int(sifted_length),
+            'eve_active': bool(eve)
+        } for timestamp, qber, fidelity, sifted_length, eve in zip(
+            columns['timestamp'], columns['qber'], columns['fidelity'], columns['sifted_length'], columns['eve_active']
+        )]
+
     def get_dashboard_stats(self):
+        history = self.get_history(20)
         return {
             'total_sessions': self.key_generation_count,
             'average_qber': round(self.get_average_qber(), 2),
             'average_fidelity': round(self.get_average_fidelity(), 2),
+            'qber_stats': self.qber_stats.to_dict(),
+            'fidelity_stats': self.fidelity_stats.to_dict(),
             'threat_summary': self.get_threat_summary(),
-            'qber_history': self.qber_history[-20:],
-            'fidelity_history': self.fidelity_history[-20:]
+            'qber_history': history,
+            'fidelity_history': history
         }
@@ -1,35 +1,282 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit, join_room, leave_room
 import json
+import os
+import time
 from datetime import datetime
-from bb84 import BB84Protocol
+import numpy as np
+from bb84 import BACKENDS, BB84Protocol, basis_labels
+from changepoint import ChangePointDetector
 from eavesdropper import Eve
-from encryption import QuantumEncryption
-from medical_data import get_patient_record, get_all_records, search_records
+from encryption import QuantumEncryption, envelope_to_json, parse_wrapping_key
+from medical_data import get_patient_record, list_records as list_patient_records, search_records_page
 from analytics import SecurityAnalytics
+from timeseries import MetricsTimeSeries
+from key_pool import QuantumKeyPool
+from batch_pipeline import BatchEncryptionPipeline
+from record_vault import RecordVault
+from event_bus import EventBus
+from status_state import VersionedState
+from key_rotation import KeyRotationJob
+from state_backend import create_state_backend
+from qkd_jobs import FINISHED_STATES, QKDJobManager
+from instrumentation import metrics
 
 app = Flask(__name__)
 CORS(app)
 socketio = SocketIO(app, cors_allowed_origins="*")
+# Outbound events are emitted from a background task so request handlers never wait on Socket.IO
+event_bus = EventBus(
+    socketio,
+    window=float(os.environ.get('MEDREC_EVENT_COALESCE_WINDOW', 0.25)),
+    max_queue=int(os.environ.get('MEDREC_EVENT_QUEUE_SIZE', 1024))
+)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
 
 quantum_crypto = QuantumEncryption()
-analytics = SecurityAnalytics()
-security_log = []
-current_qber = 0
-eve_active = False
-eve_strategy = 'random'
-encrypted_records = {}
+# Every QKD session is persisted here; the in-memory analytics ring only covers recent ones
+metrics_timeseries = MetricsTimeSeries(os.environ.get('MEDREC_TIMESERIES_PATH', os.path.join(DATA_DIR, 'metrics.sqlite3')))
+analytics = SecurityAnalytics(
+    capacity=int(os.environ.get('MEDREC_ANALYTICS_CAPACITY', 50)),
+    threat_capacity=int(os.environ.get('MEDREC_ANALYTICS_THREAT_CAPACITY', 100)),
+    timeseries=metrics_timeseries
+)
+# QBER, Eve settings, the security log, actor connections, the key ring, session analytics and
+# status versions live in a state backend: process-local by default, or an SQLite file shared by
+# every worker on the host
+state = create_state_backend(os.environ.get('MEDREC_STATE_BACKEND'))
+# The key ring is only written to a shared backend wrapped under MEDREC_STATE_KEY; without it a
+# shared backend refuses to start rather than persist raw AES keys
+if state.shared and not os.environ.get('MEDREC_STATE_KEY'):
+    raise RuntimeError("MEDREC_STATE_KEY is required with a shared state backend")
+STATE_KEY = parse_wrapping_key(os.environ['MEDREC_STATE_KEY']) if state.shared else None
+SECURITY_DEFAULTS = {
+    'current_qber': 0,
+    'eve_active': False,
+    'eve_strategy': 'random',
+    'eve_fraction': 1.0
+}
+# Encrypted envelopes live on disk so they survive restarts and are shared by all workers' reads
+encrypted_records = RecordVault(os.environ.get('MEDREC_VAULT_DIR', os.path.join(DATA_DIR, 'vault')), shared=state.shared)
+# Every rotation rewrites the whole vault; once superseded envelopes pass this share of the
+# segment bytes, a completed rotation compacts it (exclusive vaults only)
+VAULT_COMPACT_RATIO = float(os.environ.get('MEDREC_VAULT_COMPACT_RATIO', 0.5))
+
+# Security status is versioned: each change bumps a sequence number so clients can fetch deltas
+status_state = VersionedState(state)
 
 # Active connections
-active_connections = {
-    'alice': None,
-    'bob': None,
-    'eve': None
+ACTORS = ('alice', 'bob', 'eve')
+
+def security_state():
+    return state.get_many(SECURITY_DEFAULTS)
+
+# Rounds that don't use the progressive early abort are watched by CUSUM/SPRT change-point
+# detection, so an attack starting mid-round stops it within one detection chunk
+CHANGEPOINT_DETECTION = os.environ.get('MEDREC_CHANGEPOINT_DETECTION', '1') != '0'
+
+def run_bb84_session(key_length, backend='numpy', early_abort=False, progress=None, seed=None):
+    bb84 = BB84Protocol(key_length, backend=backend, seed=seed)
+    qubits = bb84.alice.prepare_qubits()
+    security = security_state()
+    
+    eve_stats = None
+    intercepted_qubits = None
+    if security['eve_active']:
+        eve = Eve(attack_strategy=security['eve_strategy'], backend=bb84.backend, interception_fraction=security['eve_fraction'], rng=bb84.rng)
+        intercepted_qubits = eve.intercept_and_resend(qubits)
+        eve_stats = eve.get_attack_stats()
+    
+    # Execute BB84 with potentially intercepted qubits
+    detector = ChangePointDetector() if CHANGEPOINT_DETECTION and not early_abort else None
+    bb84.execute(intercepted_qubits, early_abort=early_abort, progress=progress, detector=detector)
+    
+    return bb84, eve_stats
+
+def generate_pool_session(key_length):
+    # Refills keep running while Eve is active, so attacked rounds are cut short
+    bb84, _ = run_bb84_session(key_length, early_abort=True)
+    # Only QBER-verified sessions are kept ready in the pool
+    return bb84 if bb84.get_final_key() else None
+
+key_pool = QuantumKeyPool(
+    generate_pool_session,
+    key_length=int(os.environ.get('MEDREC_KEY_POOL_KEY_LENGTH', 100)),
+    capacity=int(os.environ.get('MEDREC_KEY_POOL_SIZE', 8)),
+    low_water=int(os.environ.get('MEDREC_KEY_POOL_LOW_WATER', 3)),
+    refill_interval=float(os.environ.get('MEDREC_KEY_POOL_REFILL_INTERVAL', 0.0)),
+    on_change=lambda: refresh_status('key_pool'),
+    on_error=lambda e: log_event('KEY_POOL_ERROR', f'Key pool refill failed: {e}', 'ERROR')
+)
+
+rotation_max_rate = os.environ.get('MEDREC_ROTATION_MAX_RECORDS_PER_SEC')
+key_rotation = KeyRotationJob(
+    encrypted_records,
+    quantum_crypto,
+    batch_size=int(os.environ.get('MEDREC_ROTATION_BATCH_SIZE', 256)),
+    max_records_per_sec=float(rotation_max_rate) if rotation_max_rate else None,
+    on_progress=lambda stats: report_rotation_progress(stats)
+)
+
+# Last shared state this worker has seen: backend version and the key ring it loaded
+synced = {'version': None, 'keys': None, 'analytics': None}
+
+@app.before_request
+def start_background_tasks():
+    key_pool.start()
+    event_bus.start()
+
+@app.before_request
+def sync_shared_state():
+    # Another worker may have installed a key, toggled Eve or logged events since our last request
+    version = state.version()
+    if version == synced['version']:
+        return
+    synced['version'] = version
+    
+    shared_keys = state.get('quantum_keys')
+    if shared_keys is not None and shared_keys != synced['keys']:
+        quantum_crypto.load_keys(shared_keys, STATE_KEY)
+        synced['keys'] = shared_keys
+    shared_analytics = state.get('analytics')
+    if shared_analytics is not None and shared_analytics != synced['analytics']:
+        analytics.load_state(shared_analytics)
+        synced['analytics'] = shared_analytics
+    refresh_status('security', 'recent_events', 'key_stats', 'analytics')
+
+def record_sessions(sessions, eve_active):
+    # QBER history, threat counts and session totals are merged into the shared copy atomically,
+    # so every worker's dashboard counts every worker's sessions
+    if not state.shared:
+        for metrics in sessions:
+            analytics.record_qkd_session(metrics, eve_active)
+        return
+    
+    def merge(shared):
+        if shared is not None:
+            analytics.load_state(shared)
+        for metrics in sessions:
+            analytics.record_qkd_session(metrics, eve_active)
+        return analytics.export_state()
+    
+    synced['analytics'] = state.update('analytics', merge)
+
+def share_quantum_keys(retired=()):
+    # Merged rather than overwritten, so a key another worker installed concurrently stays usable.
+    # A process-local backend has nobody to share with, and the ring never leaves this process
+    if not state.shared:
+        return
+    exported = quantum_crypto.export_keys(STATE_KEY)
+    
+    def merge(shared):
+        keys = dict(shared['keys']) if shared else {}
+        keys.update(exported['keys'])
+        # A finished rotation only prunes keys; it never demotes a newer key another worker installed
+        current = shared if shared and retired else exported
+        for key_id in retired:
+            if key_id != current['key_id']:
+                keys.pop(str(key_id), None)
+        return dict(current, keys=keys)
+    
+    synced['keys'] = state.update('quantum_keys', merge)
+    quantum_crypto.load_keys(synced['keys'], STATE_KEY)
+
+def report_rotation_progress(stats):
+    publish_event('key_rotation_progress', stats)
+    # Retired keys leave the ring once a rotation completes
+    if stats['state'] == 'completed' and stats['retired_keys']:
+        share_quantum_keys(retired=stats['retired_keys'])
+    if stats['state'] == 'completed':
+        compact_vault()
+    refresh_status('key_stats')
+
+def compact_vault():
+    # Shared vaults are read by other workers' mappings, so only an exclusive one is compacted here
+    if encrypted_records.shared:
+        return None
+    before = encrypted_records.get_stats()
+    if before['garbage_ratio'] < VAULT_COMPACT_RATIO:
+        return None
+    after = encrypted_records.compact()
+    log_event('VAULT_COMPACTED', f"Record vault compacted from {before['total_bytes']} to {after['total_bytes']} bytes", 'INFO', {
+        'garbage_ratio': before['garbage_ratio'],
+        'segments': after['segments']
+    })
+    return after
+
+def install_quantum_key(final_key):
+    # Older keys stay in the ring until the rotation job has moved every stored record off them
+    key_id = quantum_crypto.set_quantum_key(final_key)
+    share_quantum_keys()
+    if len(encrypted_records) or len(quantum_crypto.keys) > 1:
+        key_rotation.start()
+    refresh_status('key_stats')
+    return key_id
+
+def ensure_quantum_key():
+    # Encryption never waits on quantum simulation: install a pre-generated key if none is active
+    if quantum_crypto.key is None:
+        session = key_pool.acquire()
+        if session is not None:
+            final_key = session.get_final_key()
+            install_quantum_key(final_key)
+            log_event('KEY_GENERATED', f'Quantum key installed from key pool (length: {len(final_key)})', 'INFO')
+
+def publish_event(event, data):
+    # Routed to the actor rooms in event_bus.EVENT_ROUTES
+    event_bus.publish(event, data)
+
+def get_threat_level(qber):
+    if qber > 11:
+        return 'CRITICAL'
+    if qber > 5:
+        return 'ELEVATED'
+    return 'LOW'
+
+def security_section():
+    security = security_state()
+    eve_active = security['eve_active']
+    return {
+        'qber': round(security['current_qber'], 2),
+        'eve_active': eve_active,
+        'eve_strategy': security['eve_strategy'] if eve_active else None,
+        'eve_fraction': security['eve_fraction'] if eve_active else None,
+        'key_status': 'active' if quantum_crypto.key else 'none',
+        'threat_level': get_threat_level(security['current_qber'])
+    }
+
+STATUS_SECTIONS = {
+    'security': security_section,
+    'recent_events': lambda: state.tail('security_log', 10),
+    'analytics': lambda: analytics.get_dashboard_stats(),
+    'key_stats': lambda: quantum_crypto.get_key_stats(),
+    # Depth, refill rate and time-to-key; refreshed by the pool on every refill and acquire
+    'key_pool': lambda: key_pool.get_stats()
 }
 
-def broadcast_to_all(event, data):
-    socketio.emit(event, data)
+def refresh_status(*sections):
+    # Re-reads the given sections (all by default); subscribers get one delta per coalescing window
+    changed = False
+    for name in sections or STATUS_SECTIONS:
+        changed = status_state.update(name, STATUS_SECTIONS[name]()) or changed
+    if changed:
+        event_bus.publish('security_status_delta', status_state.next_delta)
+
+KEYS_GENERATED = metrics.counter('medrec_keys_generated_total', 'QKD sessions that yielded a verified key')
+KEYS_REJECTED = {
+    status: metrics.counter('medrec_keys_rejected_total', 'QKD sessions whose key was rejected', {'status': status})
+    for status in ('rejected', 'rejected_early')
+}
+RECORDS_ENCRYPTED = metrics.counter('medrec_records_encrypted_total', 'Patient records encrypted into the vault')
+RECORDS_DECRYPTED = metrics.counter('medrec_records_decrypted_total', 'Patient records decrypted for a client')
+
+def count_key_outcome(status):
+    if status == 'success':
+        KEYS_GENERATED.inc()
+    else:
+        KEYS_REJECTED[status].inc()
 
 def log_event(event_type, message, severity='INFO', details=None):
     event = {
@@ -41,19 +288,22 @@ def log_event(event_type, message, severity='INFO', details=None):
     if details:
         event['details'] = details
     
-    security_log.append(event)
-    if len(security_log) > 100:
-        security_log.pop(0)
+    state.append('security_log', event, maxlen=100)
+    metrics.counter('medrec_security_events_total', 'Security log events', {'severity': severity}).inc()
     
-    # Only broadcast if socketio is initialized and we have connections
-    try:
-        if socketio and event_type != 'SYSTEM_START':
-            broadcast_to_all('security_event', event)
-    except:
-        pass  # Ignore broadcast errors during startup
+    if event_type != 'SYSTEM_START':
+        publish_event('security_event', event)
+    refresh_status('recent_events')
     
     return event
 
+def set_actor_connection(actor, sid):
+    return state.update(
+        'active_connections',
+        lambda connections: dict(connections, **{actor: sid}),
+        dict.fromkeys(ACTORS)
+    )
+
 # WebSocket connection handlers
 @socketio.on('connect')
 def handle_connect():
@@ -66,103 +316,370 @@ def handle_disconnect():
 @socketio.on('join_actor')
 def handle_join_actor(data):
     actor = data.get('actor')  # 'alice', 'bob', or 'eve'
-    if actor in active_connections:
-        active_connections[actor] = request.sid
+    if actor in ACTORS:
+        connections = set_actor_connection(actor, request.sid)
         join_room(actor)
         emit('actor_joined', {'actor': actor})
-        broadcast_to_all('actor_status', active_connections)
+        publish_event('actor_status', connections)
+
+@socketio.on('subscribe_status')
+def handle_subscribe_status(data=None):
+    # Sends what changed since the client's last seq, then pushes deltas to the 'status' room
+    try:
+        since = int((data or {}).get('since', 0))
+    except (TypeError, ValueError):
+        since = 0
+    join_room('status')
+    emit('security_status_delta', status_state.delta(since))
+
+@socketio.on('unsubscribe_status')
+def handle_unsubscribe_status(data=None):
+    leave_room('status')
 
 @socketio.on('leave_actor')
 def handle_leave_actor(data):
     actor = data.get('actor')
-    if actor in active_connections:
-        active_connections[actor] = None
+    if actor in ACTORS:
+        connections = set_actor_connection(actor, None)
         leave_room(actor)
-        broadcast_to_all('actor_status', active_connections)
+        publish_event('actor_status', connections)
+
+def finish_key_session(bb84, eve_active, eve_stats, key_source, replay=False):
+    # Shared by the synchronous endpoint and key generation jobs: installs the key if the round
+    # passed, records and broadcasts the outcome, and builds the response body. A replayed
+    # (caller-seeded) session is reproducible by anyone holding the seed, so its key is never installed
+    if eve_stats:
+        log_event('EAVESDROP_ATTEMPT', f'Eve intercepted transmission using {eve_stats["strategy"]} strategy', 'HIGH', eve_stats)
+    
+    # Reconciliation runs inside get_final_key, so metrics are read afterwards
+    final_key = bb84.get_final_key()
+    
+    metrics = bb84.get_metrics()
+    current_qber = metrics['qber']
+    state.set('current_qber', current_qber)
+    
+    record_sessions([metrics], eve_active)
+    
+    if final_key:
+        if not replay:
+            install_quantum_key(final_key)
+        status = 'success'
+        log_event('KEY_GENERATED', f'Quantum key generated successfully (length: {len(final_key)})', 'INFO')
+    else:
+        status = 'rejected_early' if bb84.aborted else 'rejected'
+        if bb84.change_point:
+            log_event('KEY_REJECTED', f'Key rejected early after {bb84.qubits_transmitted} qubits: '
+                      f'{bb84.change_point["method"].upper()} detected an error-rate change', 'CRITICAL', bb84.change_point)
+        elif bb84.aborted:
+            log_event('KEY_REJECTED', f'Key rejected early after {bb84.qubits_transmitted} qubits: '
+                      f'QBER lower bound {bb84.early_abort["qber_lower_bound"]:.2f}% above threshold', 'CRITICAL')
+        elif current_qber > 11:
+            log_event('KEY_REJECTED', f'Key rejected due to high QBER: {current_qber:.2f}%', 'CRITICAL')
+        else:
+            log_event('KEY_REJECTED', 'Key rejected: no key material left after privacy amplification', 'WARNING')
+    count_key_outcome(status)
+    
+    # Broadcast key generation to all actors
+    publish_event('key_generated', {
+        'status': status,
+        'metrics': metrics,
+        'qber': current_qber,
+        'eve_detected': eve_active and current_qber > 11,
+        'quantum_data': {
+            'alice_bits': bb84.alice.bits[:10].tolist(),
+            'alice_bases': basis_labels(bb84.alice.bases[:10]),
+            'bob_bases': basis_labels(bb84.bob.bases[:10]),
+            'bob_measurements': bb84.bob.measurements[:10].tolist(),
+            'sifted_key': bb84.sifted_key_alice[:5].tolist()
+        }
+    })
+    
+    # Also broadcast security status update
+    publish_event('security_status_update', {
+        'qber': current_qber,
+        'eve_active': eve_active,
+        'threat_level': 'CRITICAL' if current_qber > 11 else 'LOW',
+        'key_status': 'active' if final_key else 'compromised'
+    })
+    refresh_status('security', 'analytics', 'key_stats')
+    
+    response = {
+        'status': status,
+        'metrics': metrics,
+        'final_key_length': len(final_key) if final_key else 0,
+        'qubits_processed': bb84.qubits_transmitted,
+        'key_source': key_source,
+        'key_installed': bool(final_key) and not replay,
+        'eve_detected': eve_active and current_qber > 11,
+        'bb84_proof': {
+            'alice_bits': bb84.alice.bits[:20].tolist(),
+            'alice_bases': basis_labels(bb84.alice.bases[:20]),
+            'bob_bases': basis_labels(bb84.bob.bases[:20]),
+            'bob_measurements': bb84.bob.measurements[:20].tolist(),
+            'basis_matches': np.flatnonzero(bb84.alice.bases[:20] == bb84.bob.bases[:20]).tolist(),
+            'sifted_alice': bb84.sifted_key_alice[:10].tolist(),
+            'sifted_bob': bb84.sifted_key_bob[:10].tolist()
+        }
+    }
+    
+    if eve_stats:
+        response['eve_stats'] = eve_stats
+    
+    return response
+
+def parse_seed(value):
+    # Session seeds are non-negative integers. A seeded session is for replaying a round only: its
+    # key is never installed, and the seed is echoed back to the caller who supplied it and nowhere else
+    if value is None:
+        return None
+    try:
+        seed = int(value)
+    except (TypeError, ValueError):
+        seed = -1
+    if seed < 0:
+        raise ValueError("seed must be a non-negative integer")
+    return seed
+
+def parse_count(data, name, default, minimum=0, maximum=None):
+    # Integer request fields; a missing field takes `default`, which may be None
+    value = data.get(name)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be an integer")
+    if value < minimum:
+        raise ValueError(f"{name} must be at least {minimum}")
+    if maximum is not None and value > maximum:
+        raise ValueError(f"{name} must be at most {maximum}")
+    return value
+
+def parse_backend(data):
+    backend = data.get('backend', 'numpy')
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown BB84 backend: {backend}")
+    return backend
+
+QKD_MAX_KEY_LENGTH = int(os.environ.get('MEDREC_QKD_MAX_KEY_LENGTH', 1_000_000))
 
 @app.route('/api/qkd/generate', methods=['POST'])
 def generate_quantum_key():
-    global current_qber, eve_active
+    data = request.get_json() or {}
+    try:
+        # Rounds past the synchronous limit belong in /api/qkd/jobs
+        key_length = parse_count(data, 'key_length', 100, minimum=1, maximum=QKD_MAX_KEY_LENGTH)
+        backend = parse_backend(data)
+        seed = parse_seed(data.get('seed'))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
     
     try:
-        data = request.get_json() or {}
-        key_length = data.get('key_length', 100)
-        
-        bb84 = BB84Protocol(key_length)
-        qubits = bb84.alice.prepare_qubits()
+        security = security_state()
+        eve_active = security['eve_active']
+        early_abort = bool(data.get('early_abort', False))
         
         eve_stats = None
-        intercepted_qubits = None
-        if eve_active:
-            eve = Eve(attack_strategy=eve_strategy)
-            intercepted_qubits = eve.intercept_and_resend(qubits)
-            eve_stats = eve.get_attack_stats()
-            log_event('EAVESDROP_ATTEMPT', f'Eve intercepted transmission using {eve_strategy} strategy', 'HIGH', eve_stats)
-        
-        # Execute BB84 with potentially intercepted qubits
-        alice_key, bob_key = bb84.execute(intercepted_qubits)
-        
-        metrics = bb84.get_metrics()
-        current_qber = metrics['qber']
-        
-        analytics.record_qkd_session(metrics, eve_active)
-        
-        final_key = bb84.get_final_key()
-        
-        if final_key:
-            quantum_crypto.set_quantum_key(final_key)
-            status = 'success'
-            log_event('KEY_GENERATED', f'Quantum key generated successfully (length: {len(final_key)})', 'INFO')
+        # Seeded requests replay a specific session, so they never take a pooled one
+        if seed is None and not eve_active and backend == 'numpy' and key_length == key_pool.key_length:
+            # Serve a pre-verified session; only fall back to live simulation when the pool is drained
+            key_source = 'pool'
+            bb84 = key_pool.acquire(fallback=lambda: run_bb84_session(key_length, early_abort=early_abort)[0])
         else:
-            status = 'rejected'
-            log_event('KEY_REJECTED', f'Key rejected due to high QBER: {current_qber:.2f}%', 'CRITICAL')
+            key_source = 'live'
+            bb84, eve_stats = run_bb84_session(key_length, backend, early_abort, seed=seed)
         
-        # Broadcast key generation to all actors
-        broadcast_to_all('key_generated', {
-            'status': status,
-            'metrics': metrics,
-            'qber': current_qber,
-            'eve_detected': eve_active and current_qber > 11,
-            'quantum_data': {
-                'alice_bits': bb84.alice.bits[:10],
-                'alice_bases': bb84.alice.bases[:10],
-                'bob_bases': bb84.bob.bases[:10],
-                'bob_measurements': bb84.bob.measurements[:10],
-                'sifted_key': bb84.sifted_key_alice[:5]
-            }
-        })
+        response = finish_key_session(bb84, eve_active, eve_stats, key_source, replay=seed is not None)
+        if seed is not None:
+            response['seed'] = seed
+        return jsonify(response)
+    
+    except Exception as e:
+        log_event('ERROR', f'Key generation failed: {str(e)}', 'ERROR')
+        return jsonify({'error': str(e)}), 500
+
+def run_key_job(job):
+    params = job.params
+    eve_active = security_state()['eve_active']
+    
+    def progress(bb84):
+        job.check_cancelled()
+        if state.shared and job.id in state.get('qkd_job_cancellations', []):
+            # Cancelled through another worker
+            job.cancel()
+            job.check_cancelled()
+        qkd_jobs.report(
+            job,
+            force=bb84.qubits_transmitted == bb84.key_length,
+            stage='measuring',
+            qubits_measured=bb84.qubits_transmitted,
+            key_length=bb84.key_length,
+            fraction=round(bb84.qubits_transmitted / bb84.key_length, 4),
+            qber=round(bb84.calculate_qber(), 4)
+        )
+    
+    seed = job.private.get('seed')
+    bb84, eve_stats = run_bb84_session(params['key_length'], params['backend'], params['early_abort'], progress, seed)
+    job.check_cancelled()
+    # Reconciliation and privacy amplification run as one step; the result is cached on the
+    # session, so a job cancelled meanwhile never installs its key
+    qkd_jobs.report(job, force=True, stage='reconciling')
+    bb84.get_final_key()
+    job.check_cancelled()
+    return finish_key_session(bb84, eve_active, eve_stats, 'job', replay=seed is not None)
+
+def report_job_update(job, kind):
+    if kind == 'progress':
+        publish_event('qkd_job_progress', {'id': job.id, 'state': job.state, 'progress': dict(job.progress)})
+        return
+    publish_event('qkd_job_status', job.to_dict())
+    if state.shared:
+        # Other workers answer GET /api/qkd/jobs/<id> for this job from the mirrored copy
+        share_job(job.to_dict(result=job.finished))
+
+def share_job(job):
+    def merge(jobs):
+        jobs = dict(jobs, **{job['id']: job})
+        return dict(list(jobs.items())[-qkd_jobs.retention:])
+    state.update('qkd_jobs', merge, {})
+
+# Long rounds run off the request thread; one oversized request can only hold one of the slots
+qkd_jobs = QKDJobManager(
+    run_key_job,
+    max_concurrent=int(os.environ.get('MEDREC_QKD_JOB_WORKERS', 2)),
+    max_pending=int(os.environ.get('MEDREC_QKD_JOB_QUEUE', 8)),
+    on_update=report_job_update
+)
+QKD_JOB_MAX_KEY_LENGTH = int(os.environ.get('MEDREC_QKD_JOB_MAX_KEY_LENGTH', 10_000_000))
+QKD_BATCH_MAX_KEY_LENGTH = int(os.environ.get('MEDREC_QKD_BATCH_MAX_KEY_LENGTH', 100_000))
+
+def find_job(job_id):
+    job = qkd_jobs.get(job_id)
+    if job is not None:
+        return job.to_dict(result=True)
+    return state.get('qkd_jobs', {}).get(job_id) if state.shared else None
+
+@app.route('/api/qkd/jobs', methods=['POST'])
+def submit_key_job():
+    data = request.get_json() or {}
+    try:
+        key_length = int(data.get('key_length', 100))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'key_length must be an integer'}), 400
+    if not 0 < key_length <= QKD_JOB_MAX_KEY_LENGTH:
+        return jsonify({'error': f'key_length must be between 1 and {QKD_JOB_MAX_KEY_LENGTH}'}), 400
+    backend = data.get('backend', 'numpy')
+    if backend not in BACKENDS:
+        return jsonify({'error': f'Unknown BB84 backend: {backend}'}), 400
+    try:
+        seed = parse_seed(data.get('seed'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'seed must be a non-negative integer'}), 400
+    
+    # Job params are broadcast with every status event, so the seed travels separately
+    job = qkd_jobs.submit({
+        'key_length': key_length,
+        'backend': backend,
+        'early_abort': bool(data.get('early_abort', False)),
+        'replay': seed is not None
+    }, private={'seed': seed})
+    if job is None:
+        return jsonify({'error': 'Too many key generation jobs in progress, retry later'}), 429
+    
+    return jsonify(job.to_dict()), 202, {'Location': f'/api/qkd/jobs/{job.id}'}
+
+@app.route('/api/qkd/jobs', methods=['GET'])
+def list_key_jobs():
+    return jsonify({
+        'jobs': [job.to_dict() for job in qkd_jobs.list()],
+        'stats': qkd_jobs.get_stats()
+    })
+
+@app.route('/api/qkd/jobs/<job_id>', methods=['GET'])
+def get_key_job(job_id):
+    job = find_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@app.route('/api/qkd/jobs/<job_id>', methods=['DELETE'])
+def cancel_key_job(job_id):
+    # 202 while a running job still has to reach its next chunk boundary
+    job = qkd_jobs.cancel(job_id)
+    if job is not None:
+        return jsonify(job.to_dict()), 200 if job.finished else 202
+    
+    shared = find_job(job_id)
+    if shared is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if shared['state'] not in FINISHED_STATES:
+        # Owned by another worker, which checks for cancellations between chunks
+        state.update('qkd_job_cancellations', lambda ids: (ids + [job_id])[-qkd_jobs.retention:], [])
+        return jsonify(dict(shared, cancel_requested=True)), 202
+    return jsonify(shared)
+
+@app.route('/api/qkd/generate-batch', methods=['POST'])
+def generate_quantum_key_batch():
+    data = request.get_json() or {}
+    try:
+        n_sessions = min(parse_count(data, 'n_sessions', 10, minimum=1), 10000)
+        # Every pool worker holds a whole session, so one request can't ask for unbounded rounds
+        key_length = parse_count(data, 'key_length', 100, minimum=1, maximum=QKD_BATCH_MAX_KEY_LENGTH)
+        workers = parse_count(data, 'workers', None, minimum=1)
+        seed = parse_seed(data.get('seed'))
+        backend = parse_backend(data)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        security = security_state()
+        eve_active = security['eve_active']
         
-        # Also broadcast security status update
-        broadcast_to_all('security_status_update', {
-            'qber': current_qber,
-            'eve_active': eve_active,
-            'threat_level': 'CRITICAL' if current_qber > 11 else 'LOW',
-            'key_status': 'active' if final_key else 'compromised'
-        })
+        start = time.perf_counter()
+        sessions = BB84Protocol.execute_many(
+            n_sessions,
+            key_length,
+            workers=workers,
+            backend=backend,
+            seed=seed,
+            eve_strategy=security['eve_strategy'] if eve_active else None,
+            eve_fraction=security['eve_fraction'],
+            early_abort=bool(data.get('early_abort', False))
+        )
+        elapsed = time.perf_counter() - start
         
-        response = {
-            'status': status,
-            'metrics': metrics,
-            'final_key_length': len(final_key) if final_key else 0,
-            'eve_detected': eve_active and current_qber > 11,
-            'bb84_proof': {
-                'alice_bits': bb84.alice.bits[:20],
-                'alice_bases': bb84.alice.bases[:20],
-                'bob_bases': bb84.bob.bases[:20],
-                'bob_measurements': bb84.bob.measurements[:20],
-                'basis_matches': [i for i in range(20) if bb84.alice.bases[i] == bb84.bob.bases[i]],
-                'sifted_alice': bb84.sifted_key_alice[:10],
-                'sifted_bob': bb84.sifted_key_bob[:10]
+        record_sessions([session['metrics'] for session in sessions], eve_active)
+        results = []
+        for session in sessions:
+            if session['final_key']:
+                status = 'success'
+            else:
+                status = 'rejected_early' if session['metrics']['aborted'] else 'rejected'
+            count_key_outcome(status)
+            result = {
+                'status': status,
+                'metrics': session['metrics'],
+                'final_key_length': len(session['final_key'])
             }
-        }
+            if session['eve_stats']:
+                result['eve_stats'] = session['eve_stats']
+            results.append(result)
         
-        if eve_stats:
-            response['eve_stats'] = eve_stats
+        accepted = sum(1 for r in results if r['status'] == 'success')
+        refresh_status('analytics')
+        log_event('KEY_BATCH_GENERATED', f'Generated {accepted}/{n_sessions} quantum keys in parallel', 'INFO')
         
-        return jsonify(response)
+        return jsonify({
+            'status': 'success',
+            'sessions': results,
+            'accepted': accepted,
+            'rejected': n_sessions - accepted,
+            'elapsed': elapsed,
+            'keys_per_sec': accepted / elapsed if elapsed else 0
+        })
     
     except Exception as e:
-        log_event('ERROR', f'Key generation failed: {str(e)}', 'ERROR')
+        log_event('ERROR', f'Batch key generation failed: {str(e)}', 'ERROR')
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/records/encrypt', methods=['POST'])
@@ -175,28 +692,37 @@ def encrypt_record():
         if not record:
             return jsonify({'error': 'Patient not found'}), 404
         
+        ensure_quantum_key()
         encrypted = quantum_crypto.encrypt(record)
-        encrypted_records[patient_id] = encrypted
+        encrypted_records.put(patient_id, encrypted)
+        RECORDS_ENCRYPTED.inc()
+        
+        # Binary envelopes are only base64-encoded here, at the HTTP/Socket.IO edge
+        encrypted_at = datetime.now().isoformat()
+        encrypted_view = envelope_to_json(encrypted)
+        encrypted_view['encrypted_at'] = encrypted_at
         
         # Broadcast encryption to all actors
-        broadcast_to_all('data_encrypted', {
+        publish_event('data_encrypted', {
             'patient_id': patient_id,
             'patient_name': record['name'],
-            'encrypted_data': encrypted,
-            'timestamp': datetime.now().isoformat()
+            'encrypted_data': encrypted_view,
+            'timestamp': encrypted_at
         })
         
         log_event('RECORD_ENCRYPTED', f'Record encrypted for patient {patient_id}', 'INFO')
+        refresh_status('key_stats')
         
         return jsonify({
             'status': 'encrypted',
             'patient_id': patient_id,
             'patient_name': record['name'],
-            'encrypted_data': encrypted,
+            'encrypted_data': encrypted_view,
             'encryption_stats': {
                 'algorithm': 'AES-256-GCM',
                 'key_type': 'Quantum-derived',
-                'encrypted_at': encrypted['encrypted_at']
+                'envelope_bytes': len(encrypted),
+                'encrypted_at': encrypted_at
             }
         })
     except ValueError as e:
@@ -208,6 +734,7 @@ def encrypt_record():
 @app.route('/api/records/decrypt', methods=['POST'])
 def decrypt_record():
     try:
+        current_qber = state.get('current_qber', 0)
         if current_qber > 11:
             log_event('DECRYPTION_BLOCKED', f'Decryption blocked due to compromised key (QBER: {current_qber:.2f}%)', 'CRITICAL')
             return jsonify({
@@ -218,8 +745,14 @@ def decrypt_record():
         
         data = request.get_json()
         encrypted_data = data.get('encrypted_data')
+        if encrypted_data is None and data.get('patient_id'):
+            # Decrypt straight from the vault's mapped segment
+            encrypted_data = encrypted_records.get(data['patient_id'])
+            if encrypted_data is None:
+                return jsonify({'error': 'No encrypted record for patient'}), 404
         
         decrypted = quantum_crypto.decrypt(encrypted_data)
+        RECORDS_DECRYPTED.inc()
         record = json.loads(decrypted)
         
         log_event('RECORD_DECRYPTED', f'Record decrypted for patient {record.get("patient_id")}', 'INFO')
@@ -234,23 +767,47 @@ def decrypt_record():
 
 @app.route('/api/records/encrypt-batch', methods=['POST'])
 def encrypt_batch():
+    data = request.get_json() or {}
+    try:
+        workers = parse_count(data, 'workers', None, minimum=1)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
     try:
-        data = request.get_json()
         patient_ids = data.get('patient_ids', [])
         
-        results = []
-        for patient_id in patient_ids:
-            record = get_patient_record(patient_id)
-            if record:
-                encrypted = quantum_crypto.encrypt(record)
-                encrypted_records[patient_id] = encrypted
-                results.append({
-                    'patient_id': patient_id,
-                    'status': 'encrypted',
-                    'name': record['name']
-                })
+        ensure_quantum_key()
+        # A key installed mid-batch is rotated again once the batch is done, so nothing stays on the old key
+        pipeline = BatchEncryptionPipeline(get_patient_record, quantum_crypto, workers=workers, on_stale_key=key_rotation.start)
+        
+        def encrypted_results():
+            for patient_id, record, envelope in pipeline.run(patient_ids):
+                if record:
+                    encrypted_records.put(patient_id, envelope)
+                    RECORDS_ENCRYPTED.inc()
+                    yield {
+                        'patient_id': patient_id,
+                        'status': 'encrypted',
+                        'name': record['name']
+                    }
+        
+        # NDJSON lets clients consume results while the rest of the batch is still encrypting
+        if request.args.get('stream') or 'application/x-ndjson' in request.headers.get('Accept', ''):
+            def ndjson():
+                count = 0
+                for result in encrypted_results():
+                    count += 1
+                    yield json.dumps(result) + '\n'
+                log_event('BATCH_ENCRYPTED', f'Batch encrypted {count} records', 'INFO')
+                refresh_status('key_stats')
+                yield json.dumps({'status': 'success', 'encrypted_count': count}) + '\n'
+            
+            return Response(stream_with_context(ndjson()), mimetype='application/x-ndjson')
+        
+        results = list(encrypted_results())
         
         log_event('BATCH_ENCRYPTED', f'Batch encrypted {len(results)} records', 'INFO')
+        refresh_status('key_stats')
         
         return jsonify({
             'status': 'success',
@@ -260,29 +817,58 @@ def encrypt_batch():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def status_snapshot(values):
+    snapshot = dict(values.get('security', {}))
+    snapshot.update({name: value for name, value in values.items() if name != 'security'})
+    return snapshot
+
 @app.route('/api/security/status', methods=['GET'])
 def security_status():
-    threat_level = 'LOW'
-    if current_qber > 11:
-        threat_level = 'CRITICAL'
-    elif current_qber > 5:
-        threat_level = 'ELEVATED'
+    # Full snapshot by default, or only the sections changed after ?since=<seq>. The ETag names the
+    # state's seq, so pollers that are already current get an empty 304
+    if request.if_none_match.contains_weak(status_state.etag().strip('"')):
+        return Response(status=304, headers={'ETag': status_state.etag()})
+    
+    since = request.args.get('since')
+    if since is not None:
+        try:
+            delta = status_state.delta(int(since))
+        except ValueError:
+            return jsonify({'error': 'since must be an integer sequence number'}), 400
+        response = jsonify(delta)
+        response.headers['ETag'] = status_state.etag(delta['seq'])
+        return response
     
+    seq, body = status_state.snapshot_json(status_snapshot)
+    return Response(body, mimetype='application/json', headers={'ETag': status_state.etag(seq)})
+
+@app.route('/api/system/stats', methods=['GET'])
+def system_stats():
     return jsonify({
-        'qber': round(current_qber, 2),
-        'eve_active': eve_active,
-        'eve_strategy': eve_strategy if eve_active else None,
-        'key_status': 'active' if quantum_crypto.key else 'none',
-        'threat_level': threat_level,
-        'recent_events': security_log[-10:],
-        'analytics': analytics.get_dashboard_stats(),
-        'key_stats': quantum_crypto.get_key_stats()
+        'key_pool': key_pool.get_stats(),
+        'key_rotation': key_rotation.get_stats(),
+        'event_bus': event_bus.get_stats(),
+        'qkd_jobs': qkd_jobs.get_stats(),
+        'vault': encrypted_records.get_stats(),
+        'state_backend': {'type': type(state).__name__, 'shared': state.shared, 'version': state.version()}
     })
 
+# Current state, read only when /api/metrics is scraped
+metrics.gauge('medrec_qber_percent', 'QBER of the latest QKD session', lambda: state.get('current_qber', 0))
+metrics.gauge('medrec_key_pool_depth', 'Verified sessions waiting in the key pool', lambda: key_pool.get_stats()['depth'])
+metrics.gauge('medrec_key_ring_size', 'Keys in the encryption key ring', lambda: len(quantum_crypto.keys))
+metrics.gauge('medrec_vault_records', 'Encrypted records in the vault', lambda: len(encrypted_records))
+metrics.gauge('medrec_event_bus_queue_depth', 'Events waiting for the Socket.IO emitter', lambda: event_bus.get_stats()['queue_depth'])
+metrics.gauge('medrec_qkd_jobs_running', 'Key generation jobs currently running', lambda: qkd_jobs.get_stats()['jobs']['running'])
+metrics.gauge('medrec_metrics_enabled', 'Whether timers and counters are recording (MEDREC_METRICS)', lambda: int(metrics.enabled))
+
+@app.route('/api/metrics', methods=['GET'])
+def prometheus_metrics():
+    # Prometheus text exposition format; histograms and counters are per worker process
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/api/attack/simulate', methods=['POST'])
 def simulate_attack():
-    global eve_active, eve_strategy
-    
     data = request.get_json() or {}
     eve_active = data.get('active', True)
     eve_strategy = data.get('strategy', 'random')
@@ -290,51 +876,105 @@ def simulate_attack():
     if not eve_strategy in ['random', 'z_only', 'x_only']:
         eve_strategy = 'random'
     
+    try:
+        eve_fraction = min(max(float(data.get('fraction', 1.0)), 0.0), 1.0)
+    except (TypeError, ValueError):
+        eve_fraction = 1.0
+    
+    state.set_many({'eve_active': eve_active, 'eve_strategy': eve_strategy, 'eve_fraction': eve_fraction})
+    
     message = f'Eavesdropping attack {"activated" if eve_active else "deactivated"}'
     if eve_active:
         message += f' with {eve_strategy} strategy'
+        if eve_fraction < 1.0:
+            message += f' ({eve_fraction:.0%} of qubits)'
         
     log_event('ATTACK_SIMULATION', message, 'WARNING' if eve_active else 'INFO')
+    refresh_status('security')
     
     return jsonify({
         'eve_active': eve_active,
         'strategy': eve_strategy,
+        'fraction': eve_fraction,
         'message': message
     })
 
+def page_args(default_limit=100, max_limit=1000):
+    try:
+        offset = max(int(request.args.get('offset', 0)), 0)
+        limit = min(max(int(request.args.get('limit', default_limit)), 0), max_limit)
+    except ValueError:
+        offset, limit = 0, default_limit
+    return offset, limit
+
 @app.route('/api/records/list', methods=['GET'])
 def list_records():
+    offset, limit = page_args()
+    total, records = list_patient_records(offset, limit)
     return jsonify({
+        'total': total,
+        'offset': offset,
+        'limit': limit,
         'records': [{
             'patient_id': r['patient_id'], 
             'name': r['name'],
             'age': r['age'],
             'diagnosis': r['diagnosis'],
             'encrypted': r['patient_id'] in encrypted_records
-        } for r in get_all_records()]
+        } for r in records]
     })
 
 @app.route('/api/records/search', methods=['GET'])
 def search_records_endpoint():
     query = request.args.get('q', '')
-    results = search_records(query)
+    offset, limit = page_args()
+    total, results = search_records_page(query, offset, limit)
     return jsonify({
         'query': query,
-        'count': len(results),
+        'count': total,
+        'offset': offset,
+        'limit': limit,
         'results': results
     })
 
 @app.route('/api/key/history', methods=['GET'])
 def key_history():
     return jsonify({
-        'events': security_log,
+        'events': state.tail('security_log'),
         'key_stats': quantum_crypto.get_key_stats()
     })
 
+@app.route('/api/key/rotation', methods=['GET'])
+def key_rotation_status():
+    return jsonify({
+        'rotation': key_rotation.get_stats(),
+        'vault': encrypted_records.get_stats()
+    })
+
 @app.route('/api/analytics/dashboard', methods=['GET'])
 def analytics_dashboard():
     return jsonify(analytics.get_dashboard_stats())
 
+def parse_time_arg(name, default):
+    # Accepts epoch seconds or an ISO-8601 timestamp
+    value = request.args.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+@app.route('/api/analytics/timeseries', methods=['GET'])
+def analytics_timeseries():
+    try:
+        end = parse_time_arg('to', time.time())
+        start = parse_time_arg('from', end - 86400)
+        bucket = int(request.args.get('bucket', 3600))
+        return jsonify(metrics_timeseries.query(start, end, bucket))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
 @app.route('/api/demo/scenario', methods=['POST'])
 def run_demo_scenario():
     data = request.get_json() or {}
@@ -343,8 +983,7 @@ def run_demo_scenario():
     results = []
     
     if scenario == 'normal':
-        global eve_active
-        eve_active = False
+        state.set('eve_active', False)
         
         key_response = generate_quantum_key()
         results.append({'step': 'key_generation', 'result': key_response.get_json()})
@@ -353,7 +992,7 @@ def run_demo_scenario():
         results.append({'step': 'encryption', 'result': encrypt_response.get_json()})
         
     elif scenario == 'attack':
-        eve_active = True
+        state.set('eve_active', True)
         
         key_response = generate_quantum_key()
         results.append({'step': 'key_generation_with_eve', 'result': key_response.get_json()})
@@ -375,6 +1014,14 @@ def health_check():
         }
     })
 
+# A worker joining a shared backend starts from the shared key ring and analytics, so its first
+# section values don't overwrite what the other workers already published
+sync_shared_state()
+# Initial state is served through snapshots; pushes only ever carry later changes
+for name, build in STATUS_SECTIONS.items():
+    status_state.update(name, build())
+status_state.mark_pushed()
+
 if __name__ == '__main__':
     log_event('SYSTEM_START', 'Quantum Health Shield backend initialized', 'INFO')
     socketio.run(app, debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,59 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from encryption import serialize_record
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def serialize_compact(record):
+    if orjson is not None:
+        return orjson.dumps(record)
+    return serialize_record(record)
+
+class BatchEncryptionPipeline:
+    # fetch -> serialize -> encrypt; fetch and serialize run on the caller's thread while
+    # AES-GCM runs on a pool (PyCryptodome drops the GIL inside its C ciphers). At most
+    # `window` records are in flight, so memory stays flat however long the batch is
+    def __init__(self, fetch_record, crypto, workers=None, window=None, on_stale_key=None):
+        self.fetch_record = fetch_record
+        self.crypto = crypto
+        # Called when the batch finishes under a key that was replaced while it ran
+        self.on_stale_key = on_stale_key
+        # Threads beyond the core count only queue behind the GIL-free cipher calls
+        cpus = os.cpu_count() or 1
+        self.workers = max(1, min(workers or cpus, cpus))
+        self.window = window or self.workers * 64
+
+    def _serialized(self, patient_ids):
+        for patient_id in patient_ids:
+            record = self.fetch_record(patient_id)
+            yield patient_id, record, serialize_compact(record) if record else None
+
+    def run(self, patient_ids):
+        # Yields (patient_id, record, envelope) in request order; record is None if not found.
+        # The key stays leased until the caller has stored the last envelope and asks for the next
+        in_flight = deque()
+
+        with self.crypto.lease(self.on_stale_key) as seal, \
+                ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='batch-encrypt') as pool:
+            for patient_id, record, payload in self._serialized(patient_ids):
+                future = pool.submit(seal, payload) if payload is not None else None
+                in_flight.append((patient_id, record, future))
+
+                if len(in_flight) >= self.window:
+                    yield self._complete(in_flight.popleft())
+
+            while in_flight:
+                yield self._complete(in_flight.popleft())
+
+    def _complete(self, item):
+        patient_id, record, future = item
+        if future is None:
+            return patient_id, None, None
+
+        envelope = future.result()
+        self.crypto.encryption_count += 1
+        return patient_id, record, envelope
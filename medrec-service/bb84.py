@@ -1,123 +1,485 @@
-import random
+import multiprocessing
+import os
+import secrets
+from statistics import NormalDist
 import numpy as np
-from qiskit import QuantumCircuit, transpile
-from qiskit_aer import Aer
+from concurrent.futures import ProcessPoolExecutor
+from qiskit import QuantumCircuit
+from qiskit_aer import AerSimulator
 from datetime import datetime
+from packed_key import PackedKey
+from reconciliation import cascade
+from privacy_amplification import privacy_amplify
+from changepoint import error_indicators
+from instrumentation import metrics
+
+# Bases are encoded as 0 = Z (rectilinear) and 1 = X (diagonal)
+BASIS_LABELS = np.array(['Z', 'X'])
+# Observed per call: a whole round, or one chunk/block in chunked, progressive and streamed rounds
+PREPARE_SECONDS = metrics.histogram('medrec_bb84_prepare_seconds', 'Alice drawing bits and bases for her qubits')
+MEASURE_SECONDS = metrics.histogram('medrec_bb84_measure_seconds', "Bob's measurement of the received qubits")
+SIFT_SECONDS = metrics.histogram('medrec_bb84_sift_seconds', 'Basis sifting and error counting')
+KEY_DERIVATION_SECONDS = metrics.histogram(
+    'medrec_bb84_key_derivation_seconds', 'Cascade reconciliation and privacy amplification of a verified round'
+)
+
+# Qubits measured between progress reports when a round is run with a progress callback
+PROGRESS_CHUNK_SIZE = 65536
+# Qubits measured between change-point checks; an attacked round stops within one such chunk
+DETECTION_CHUNK_SIZE = 4096
+
+def basis_labels(bases):
+    return BASIS_LABELS[np.asarray(bases, dtype=np.uint8)].tolist()
+
+def session_rng(seed=None):
+    # Every random draw in a session (bits, bases, Eve, Cascade permutations, the Toeplitz seed and
+    # simulator seeds) comes from this one generator, so a session seed replays it bit for bit
+    if seed is None:
+        seed = secrets.randbits(63)
+    return np.random.Generator(np.random.PCG64(seed)), seed
+
+def qber_lower_bound(errors, n, confidence=0.99):
+    # One-sided Wilson score lower bound (in %) on the QBER behind `errors` out of `n` test bits
+    if n == 0:
+        return 0.0
+    z = NormalDist().inv_cdf(confidence)
+    p = errors / n
+    centre = p + z * z / (2 * n)
+    margin = z * np.sqrt(p * (1 - p) / n + z * z / (4 * n * n))
+    return max(0.0, float(centre - margin) / (1 + z * z / n)) * 100
+
+class QubitStates:
+    # BB84 states are product states, so (bit, basis) fully describes each qubit in flight
+    __slots__ = ('bits', 'bases')
+
+    def __init__(self, bits, bases):
+        self.bits = bits
+        self.bases = bases
+
+    def __len__(self):
+        return len(self.bits)
+
+class NumpyBackend:
+    name = 'numpy'
+
+    def measure(self, qubits, bases, rng):
+        # Matching basis reproduces the prepared bit, mismatched basis is a fair coin
+        outcomes = qubits.bits.copy()
+        mismatched = qubits.bases != bases
+        outcomes[mismatched] = rng.integers(0, 2, int(np.count_nonzero(mismatched)), dtype=np.uint8)
+        return outcomes
+
+class QiskitBackend:
+    name = 'qiskit'
+
+    def __init__(self, chunk_size=128):
+        # BB84 only uses Clifford gates, so the stabilizer method simulates wide chunks cheaply
+        self.simulator = AerSimulator(method='stabilizer')
+        self.chunk_size = chunk_size
+        self.circuits_run = 0
+
+    def build_circuits(self, qubits, bases):
+        circuits = []
+        for start in range(0, len(qubits), self.chunk_size):
+            stop = min(start + self.chunk_size, len(qubits))
+            width = stop - start
+            qc = QuantumCircuit(width, width)
+
+            ones = np.flatnonzero(qubits.bits[start:stop]).tolist()
+            prepared_x = np.flatnonzero(qubits.bases[start:stop]).tolist()
+            measured_x = np.flatnonzero(bases[start:stop]).tolist()
+
+            if ones:
+                qc.x(ones)
+            if prepared_x:
+                qc.h(prepared_x)
+            qc.barrier()
+            if measured_x:
+                qc.h(measured_x)
+            qc.measure(range(width), range(width))
+
+            circuits.append(qc)
+        return circuits
+
+    def measure(self, qubits, bases, rng):
+        if len(qubits) == 0:
+            return np.empty(0, dtype=np.uint8)
+
+        # Circuits only use gates native to Aer, so the whole round is submitted as
+        # a single job without per-circuit transpilation
+        circuits = self.build_circuits(qubits, bases)
+        # Aer derives each circuit's seed from seed_simulator, so the job is as reproducible as rng
+        seed = int(rng.integers(0, 2 ** 63))
+        result = self.simulator.run(circuits, shots=1, memory=True, seed_simulator=seed).result()
+        self.circuits_run += len(circuits)
+
+        # Memory strings list clbit 0 last, so each chunk is reversed into qubit order
+        memory = ''.join(result.get_memory(i)[0][::-1] for i in range(len(circuits)))
+        return np.frombuffer(memory.encode(), dtype=np.uint8) - ord('0')
+
+BACKENDS = {
+    'numpy': NumpyBackend,
+    'qiskit': QiskitBackend
+}
+
+def get_backend(backend):
+    if not isinstance(backend, str):
+        return backend
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown BB84 backend: {backend}")
+    return BACKENDS[backend]()
 
 class Alice:
-    def __init__(self, key_length=100):
+    def __init__(self, key_length=100, rng=None):
         self.key_length = key_length
-        self.bits = [random.randint(0, 1) for _ in range(key_length)]
-        self.bases = [random.choice(['Z', 'X']) for _ in range(key_length)]
-        self.qubits = []
-        
+        self.rng = rng if rng is not None else np.random.default_rng()
+        # Drawing the bits and bases is the preparation cost; prepare_qubits() only wraps them
+        with PREPARE_SECONDS.time():
+            self.bits = self.rng.integers(0, 2, key_length, dtype=np.uint8)
+            self.bases = self.rng.integers(0, 2, key_length, dtype=np.uint8)
+        self.qubits = None
+
     def prepare_qubits(self):
-        self.qubits = []
-        for i in range(self.key_length):
-            qc = QuantumCircuit(1, 1)
-            
-            if self.bits[i] == 1:
-                qc.x(0)
-            
-            if self.bases[i] == 'X':
-                qc.h(0)
-                
-            self.qubits.append(qc)
+        self.qubits = QubitStates(self.bits, self.bases)
         return self.qubits
 
 class Bob:
-    def __init__(self, key_length=100):
+    def __init__(self, key_length=100, backend='numpy', rng=None):
         self.key_length = key_length
-        self.bases = [random.choice(['Z', 'X']) for _ in range(key_length)]
-        self.measurements = []
-        self.backend = Aer.get_backend('qasm_simulator')
-        
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.bases = self.rng.integers(0, 2, key_length, dtype=np.uint8)
+        self.measurements = np.empty(0, dtype=np.uint8)
+        self.backend = get_backend(backend)
+
     def measure_qubits(self, qubits):
-        self.measurements = []
-        for i, qc in enumerate(qubits):
-            circuit = qc.copy()
-            
-            if self.bases[i] == 'X':
-                circuit.h(0)
-            
-            circuit.measure(0, 0)
-            
-            job = self.backend.run(transpile(circuit, self.backend), shots=1)
-            result = job.result()
-            counts = result.get_counts(circuit)
-            measured_bit = int(list(counts.keys())[0])
-            self.measurements.append(measured_bit)
-            
+        with MEASURE_SECONDS.time():
+            self.measurements = self.backend.measure(qubits, self.bases, self.rng)
         return self.measurements
 
 class BB84Protocol:
-    def __init__(self, key_length=100):
+    def __init__(self, key_length=100, backend='numpy', rng=None, chunk_size=None, seed=None):
         self.key_length = key_length
-        self.alice = Alice(key_length)
-        self.bob = Bob(key_length)
-        self.sifted_key_alice = []
-        self.sifted_key_bob = []
+        self.backend = get_backend(backend)
+        # An injected generator wins; otherwise the session gets its own seed. The seed determines
+        # the final key, so it stays on the session and is never reported in the metrics
+        if rng is not None:
+            self.rng, self.seed = rng, seed
+        else:
+            self.rng, self.seed = session_rng(seed)
+        self.chunk_size = chunk_size
+
+        # In streaming mode the parties only ever hold one chunk of qubits at a time
+        party_length = key_length if chunk_size is None else min(chunk_size, key_length)
+        self.alice = Alice(party_length, self.rng)
+        self.bob = Bob(party_length, self.backend, self.rng)
+
+        self.sifted_key_alice = PackedKey()
+        self.sifted_key_bob = PackedKey()
+        self.sifted_length = 0
         self.basis_matches = 0
+        self.errors = 0
+        self.streamed = False
+        self.qubits_transmitted = 0
+        self.aborted = False
+        self.change_point = None
+        self.early_abort = None
+        self.reconciliation = None
+        self.privacy_amplification = None
+        self._final_key = None
         self.execution_time = 0
-        
-    def execute(self, intercepted_qubits=None):
+
+    def _sift(self):
+        with SIFT_SECONDS.time():
+            matches = self.alice.bases == self.bob.bases
+            sifted_alice = PackedKey.from_bits(self.alice.bits[matches])
+            sifted_bob = PackedKey.from_bits(self.bob.measurements[matches])
+
+            self.basis_matches += int(np.count_nonzero(matches))
+            self.sifted_length += len(sifted_alice)
+            self.errors += sifted_alice.count_errors(sifted_bob)
+
+        return sifted_alice, sifted_bob
+
+    def _reset_counters(self):
+        self.sifted_length = 0
+        self.basis_matches = 0
+        self.errors = 0
+        self.qubits_transmitted = 0
+        self.aborted = False
+        self.change_point = None
+        self.early_abort = None
+        self.reconciliation = None
+        self.privacy_amplification = None
+        self._final_key = None
+
+    @property
+    def status(self):
+        if self.aborted:
+            return 'rejected_early'
+        return 'completed'
+
+    def execute(self, intercepted_qubits=None, early_abort=False, test_fraction=0.5, qber_threshold=11.0,
+                confidence=0.99, block_size=256, progress=None, detector=None):
+        # `progress(self)` is called after each measured block; an exception raised from it aborts the round.
+        # A ChangePointDetector stops the round at the first chunk whose sifted errors raise an alarm
+        if self.chunk_size is not None:
+            # The parties only hold the first chunk, so a whole-round execute() would silently run just that
+            raise ValueError("Sessions created with chunk_size run through execute_stream()")
         start_time = datetime.now()
-        
+        self._reset_counters()
+        self.streamed = False
+
         # Use intercepted qubits if Eve was active, otherwise use Alice's original qubits
         qubits_to_measure = intercepted_qubits if intercepted_qubits is not None else self.alice.prepare_qubits()
-        self.bob.measure_qubits(qubits_to_measure)
-        
-        self.sifted_key_alice = []
-        self.sifted_key_bob = []
-        self.basis_matches = 0
-        
-        for i in range(self.key_length):
-            if self.alice.bases[i] == self.bob.bases[i]:
-                self.sifted_key_alice.append(self.alice.bits[i])
-                self.sifted_key_bob.append(self.bob.measurements[i])
-                self.basis_matches += 1
-        
+        if early_abort:
+            self._execute_progressive(qubits_to_measure, test_fraction, qber_threshold, confidence, block_size, progress)
+        elif progress is not None or detector is not None:
+            chunk_size = DETECTION_CHUNK_SIZE if detector is not None else PROGRESS_CHUNK_SIZE
+            self._execute_chunked(qubits_to_measure, chunk_size, progress, detector)
+        else:
+            self.bob.measure_qubits(qubits_to_measure)
+            self.qubits_transmitted = len(qubits_to_measure)
+            self.sifted_key_alice, self.sifted_key_bob = self._sift()
+
         end_time = datetime.now()
         self.execution_time = (end_time - start_time).total_seconds()
-        
+
         return self.sifted_key_alice, self.sifted_key_bob
-    
+
+    def _execute_chunked(self, qubits, chunk_size, progress=None, detector=None):
+        # Same sifted keys as a single measurement, but Bob measures chunk by chunk so the
+        # running QBER can be reported, and an attack detected, while a long round is still in flight
+        measurements = []
+        for start in range(0, len(qubits), chunk_size):
+            stop = min(start + chunk_size, len(qubits))
+            block = QubitStates(qubits.bits[start:stop], qubits.bases[start:stop])
+            with MEASURE_SECONDS.time():
+                measured = self.bob.backend.measure(block, self.bob.bases[start:stop], self.bob.rng)
+            measurements.append(measured)
+            self.qubits_transmitted = stop
+
+            with SIFT_SECONDS.time():
+                matches = self.alice.bases[start:stop] == self.bob.bases[start:stop]
+                self.basis_matches += int(np.count_nonzero(matches))
+                self.sifted_length += int(np.count_nonzero(matches))
+                errors = (self.alice.bits[start:stop][matches] != measured[matches]).view(np.uint8)
+                self.errors += int(np.count_nonzero(errors))
+            if progress is not None:
+                progress(self)
+            if detector is not None and detector.update(errors) is not None:
+                self.aborted = True
+                self.change_point = detector.alarm
+                break
+
+        self.bob.measurements = np.concatenate(measurements) if measurements else np.empty(0, dtype=np.uint8)
+        transmitted = self.qubits_transmitted
+        with SIFT_SECONDS.time():
+            matches = self.alice.bases[:transmitted] == self.bob.bases[:transmitted]
+            self.sifted_key_alice = PackedKey.from_bits(self.alice.bits[:transmitted][matches])
+            self.sifted_key_bob = PackedKey.from_bits(self.bob.measurements[matches])
+
+    def _execute_progressive(self, qubits, test_fraction, qber_threshold, confidence, block_size, progress=None):
+        # Measures and sifts block by block, disclosing the first test_fraction of each block's
+        # sifted bits as test bits. The round stops as soon as the QBER lower confidence bound on
+        # those test bits clears qber_threshold, so an attacked round costs a few blocks
+        test_alice, test_bob, key_alice, key_bob, measurements = [], [], [], [], []
+        test_bits = test_errors = 0
+        lower_bound = 0.0
+
+        # Blocks double in size, so a clean round needs only O(log n) checks while an attacked
+        # one still stops within roughly twice the qubits the bound needed
+        start = 0
+        while start < len(qubits):
+            stop = min(start + block_size, len(qubits))
+            block_size *= 2
+            block = QubitStates(qubits.bits[start:stop], qubits.bases[start:stop])
+            with MEASURE_SECONDS.time():
+                measured = self.bob.backend.measure(block, self.bob.bases[start:stop], self.bob.rng)
+            measurements.append(measured)
+            self.qubits_transmitted = stop
+
+            with SIFT_SECONDS.time():
+                matches = self.alice.bases[start:stop] == self.bob.bases[start:stop]
+                sifted_alice = self.alice.bits[start:stop][matches]
+                sifted_bob = measured[matches]
+                self.basis_matches += len(sifted_alice)
+                self.sifted_length += len(sifted_alice)
+                self.errors += int(np.count_nonzero(sifted_alice != sifted_bob))
+
+            tested = int(len(sifted_alice) * test_fraction)
+            test_alice.append(sifted_alice[:tested])
+            test_bob.append(sifted_bob[:tested])
+            key_alice.append(sifted_alice[tested:])
+            key_bob.append(sifted_bob[tested:])
+            test_bits += tested
+            test_errors += int(np.count_nonzero(sifted_alice[:tested] != sifted_bob[:tested]))
+
+            lower_bound = qber_lower_bound(test_errors, test_bits, confidence)
+            if progress is not None:
+                progress(self)
+            if lower_bound > qber_threshold:
+                self.aborted = True
+                break
+            start = stop
+
+        self.bob.measurements = np.concatenate(measurements) if measurements else np.empty(0, dtype=np.uint8)
+        # Disclosed bits go first, so get_final_key's test prefix always covers every one of them
+        self.sifted_key_alice = PackedKey.from_bits(np.concatenate(test_alice + key_alice))
+        self.sifted_key_bob = PackedKey.from_bits(np.concatenate(test_bob + key_bob))
+        self.early_abort = {
+            'status': self.status,
+            'qubits_processed': self.qubits_transmitted,
+            'test_bits': test_bits,
+            'test_errors': test_errors,
+            'qber_lower_bound': round(lower_bound, 4),
+            'confidence': confidence
+        }
+
+    def execute_stream(self, eve=None, detector=None):
+        # Generate, transmit, measure and sift chunk by chunk; only running counters outlive a chunk.
+        # With a ChangePointDetector the round stops at the first chunk that raises an alarm, and
+        # that chunk is withheld since it may already be known to Eve
+        start_time = datetime.now()
+        self._reset_counters()
+        self.streamed = True
+        self.sifted_key_alice = PackedKey()
+        self.sifted_key_bob = PackedKey()
+
+        chunk_size = self.chunk_size or self.key_length
+        for offset in range(0, self.key_length, chunk_size):
+            length = min(chunk_size, self.key_length - offset)
+            if offset > 0:
+                self.alice = Alice(length, self.rng)
+                self.bob = Bob(length, self.backend, self.rng)
+
+            qubits = self.alice.prepare_qubits()
+            if eve is not None:
+                qubits = eve.intercept_and_resend(qubits)
+            self.bob.measure_qubits(qubits)
+            self.qubits_transmitted += length
+
+            sifted = self._sift()
+            if detector is not None and detector.update(error_indicators(*sifted)) is not None:
+                self.aborted = True
+                self.change_point = detector.alarm
+                self.execution_time = (datetime.now() - start_time).total_seconds()
+                return
+
+            yield sifted
+
+            self.execution_time = (datetime.now() - start_time).total_seconds()
+
     def calculate_qber(self):
-        if len(self.sifted_key_alice) == 0:
+        if self.sifted_length == 0:
             return 0
-        
-        errors = sum(1 for a, b in zip(self.sifted_key_alice, self.sifted_key_bob) if a != b)
-        return (errors / len(self.sifted_key_alice)) * 100
-    
+
+        return (self.errors / self.sifted_length) * 100
+
     def calculate_fidelity(self):
-        if len(self.sifted_key_alice) == 0:
+        if self.sifted_length == 0:
             return 0
-        
-        matches = sum(1 for a, b in zip(self.sifted_key_alice, self.sifted_key_bob) if a == b)
-        return (matches / len(self.sifted_key_alice)) * 100
-    
+
+        matches = self.sifted_length - self.errors
+        return (matches / self.sifted_length) * 100
+
     def get_basis_efficiency(self):
         return (self.basis_matches / self.key_length) * 100
-    
+
     def get_final_key(self, test_fraction=0.5, qber_threshold=11.0):
-        if not self.sifted_key_alice:
-            return []
-            
-        test_length = int(len(self.sifted_key_alice) * test_fraction)
-        
-        qber = self.calculate_qber()
-        if qber > qber_threshold:
-            return []
-        
-        return self.sifted_key_alice[test_length:]
-    
+        if self.streamed:
+            raise ValueError("Streamed sessions hand out sifted bits through execute_stream()")
+
+        if self._final_key is not None and self._final_key[0] == (test_fraction, qber_threshold):
+            return self._final_key[1]
+
+        final_key = PackedKey()
+        if not self.aborted and len(self.sifted_key_alice) > 0 and self.calculate_qber() <= qber_threshold:
+            test_length = int(len(self.sifted_key_alice) * test_fraction)
+
+            # Bob's half of the remaining key is reconciled against Alice's, then compressed to
+            # remove what Eve may know from the measured errors and the disclosed parities
+            with KEY_DERIVATION_SECONDS.time():
+                reconciled_key, self.reconciliation = cascade(
+                    self.sifted_key_alice[test_length:],
+                    self.sifted_key_bob[test_length:],
+                    self.calculate_qber() / 100,
+                    rng=self.rng
+                )
+                final_key, self.privacy_amplification = privacy_amplify(
+                    reconciled_key,
+                    self.calculate_qber() / 100,
+                    self.reconciliation['leaked_bits'],
+                    rng=self.rng
+                )
+
+        self._final_key = ((test_fraction, qber_threshold), final_key)
+        return final_key
+
     def get_metrics(self):
         return {
             'raw_key_length': self.key_length,
-            'sifted_key_length': len(self.sifted_key_alice),
+            'qubits_transmitted': self.qubits_transmitted,
+            'sifted_key_length': self.sifted_length,
             'basis_matches': self.basis_matches,
             'basis_efficiency': self.get_basis_efficiency(),
             'qber': self.calculate_qber(),
             'fidelity': self.calculate_fidelity(),
+            'backend': self.backend.name,
+            'reconciliation': self.reconciliation,
+            'privacy_amplification': self.privacy_amplification,
+            'status': self.status,
+            'aborted': self.aborted,
+            'change_point': self.change_point,
+            'early_abort': self.early_abort,
             'execution_time': self.execution_time
         }
+
+    @staticmethod
+    def execute_many(n_sessions, key_length=100, workers=None, backend='numpy', seed=None,
+                     eve_strategy=None, eve_fraction=1.0, early_abort=False):
+        # Sessions are independent, so each gets its own spawned seed and runs on a separate process.
+        # More processes than cores only adds start-up cost, so `workers` is capped at the core count
+        cpus = os.cpu_count() or 1
+        workers = max(1, min(workers or cpus, cpus, n_sessions))
+        backend_name = backend if isinstance(backend, str) else backend.name
+        seeds = np.random.SeedSequence(seed).spawn(n_sessions)
+        tasks = [(key_length, backend_name, s, eve_strategy, eve_fraction, early_abort) for s in seeds]
+
+        if workers == 1:
+            return [_run_session(task) for task in tasks]
+
+        # Forking a process that already runs the service's background threads can copy a held lock
+        # into the child, so workers come from a forkserver and set up their backends themselves
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('forkserver')) as pool:
+            return list(pool.map(_run_session, tasks, chunksize=max(1, n_sessions // (workers * 4))))
+
+# Simulator backends are created once per worker process and reused across its sessions
+_worker_backends = {}
+
+def _run_session(task):
+    key_length, backend_name, seed, eve_strategy, eve_fraction, early_abort = task
+
+    if backend_name not in _worker_backends:
+        _worker_backends[backend_name] = get_backend(backend_name)
+    backend = _worker_backends[backend_name]
+
+    bb84 = BB84Protocol(key_length, backend=backend, rng=np.random.default_rng(seed))
+    qubits = bb84.alice.prepare_qubits()
+
+    eve_stats = None
+    intercepted_qubits = None
+    if eve_strategy is not None:
+        # Imported lazily since eavesdropper depends on this module
+        from eavesdropper import Eve
+        eve = Eve(attack_strategy=eve_strategy, backend=backend, interception_fraction=eve_fraction, rng=bb84.rng)
+        intercepted_qubits = eve.intercept_and_resend(qubits)
+        eve_stats = eve.get_attack_stats()
+
+    bb84.execute(intercepted_qubits, early_abort=early_abort)
+    final_key = bb84.get_final_key()
+
+    return {
+        'metrics': bb84.get_metrics(),
+        'final_key': final_key,
+        'eve_stats': eve_stats
+    }
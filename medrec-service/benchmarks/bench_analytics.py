@@ -0,0 +1,86 @@
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+from harness import measure, write_results
+from analytics import SecurityAnalytics
+from timeseries import MetricsTimeSeries
+
+READS = {
+    'dashboard': lambda analytics: analytics.get_dashboard_stats(),
+    'history_20': lambda analytics: analytics.get_history(20),
+    'history_1000': lambda analytics: analytics.get_history(1000),
+    'average_qber': lambda analytics: analytics.get_average_qber(),
+    'detect_anomalies': lambda analytics: analytics.detect_anomalies(4.0)
+}
+
+def session_metrics(n, seed):
+    # Mostly clean sessions with a few elevated and attacked ones, so threats are recorded too
+    rng = np.random.default_rng(seed)
+    qber = np.where(rng.random(n) < 0.05, rng.uniform(11, 30, n), rng.uniform(0, 6, n))
+    sifted = rng.integers(40, 60, n)
+    return [
+        {'qber': float(q), 'fidelity': 100.0 - float(q), 'sifted_key_length': int(s)}
+        for q, s in zip(qber, sifted)
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description='SecurityAnalytics insert/read throughput under a large session count')
+    parser.add_argument('--sessions', type=int, default=1000000)
+    parser.add_argument('--capacities', type=int, nargs='+', default=[50, 1000000])
+    parser.add_argument('--reads', type=int, default=1000)
+    parser.add_argument('--timeseries', action='store_true', help='Also persist every session to a temporary SQLite time series')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    sessions = session_metrics(args.sessions, args.seed)
+    results = []
+    for capacity in args.capacities:
+        with tempfile.TemporaryDirectory() as directory:
+            timeseries = MetricsTimeSeries(os.path.join(directory, 'metrics.sqlite3')) if args.timeseries else None
+            analytics = SecurityAnalytics(capacity=capacity, timeseries=timeseries)
+
+            start = time.perf_counter()
+            for metrics in sessions:
+                analytics.record_qkd_session(metrics, metrics['qber'] > 11)
+            if timeseries is not None:
+                timeseries.flush()
+            elapsed = time.perf_counter() - start
+
+            suffix = '+timeseries' if timeseries is not None else ''
+            results.append({
+                'name': f'analytics/insert/capacity={capacity}{suffix}',
+                'operation': 'insert',
+                'capacity': capacity,
+                'sessions': args.sessions,
+                'timeseries': timeseries is not None,
+                'elapsed': elapsed,
+                'us_per_call': elapsed / args.sessions * 1e6,
+                'ops_per_sec': args.sessions / elapsed
+            })
+            print(f"insert   capacity={capacity:<8} {results[-1]['us_per_call']:8.2f} us/session")
+
+            for read, fn in READS.items():
+                timing = measure(lambda: [fn(analytics) for _ in range(args.reads)], repeat=3)
+                per_call = timing['mean'] / args.reads
+                results.append({
+                    'name': f'analytics/{read}/capacity={capacity}{suffix}',
+                    'operation': read,
+                    'capacity': capacity,
+                    'sessions': args.sessions,
+                    'timeseries': timeseries is not None,
+                    'time': timing,
+                    'us_per_call': per_call * 1e6,
+                    'ops_per_sec': 1 / per_call
+                })
+                print(f"{read:<16} capacity={capacity:<8} {results[-1]['us_per_call']:8.2f} us/call")
+
+            if timeseries is not None:
+                timeseries.close()
+
+    print(f"wrote {write_results('analytics', results, args.output)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+import argparse
+import statistics
+import time
+from harness import write_results
+from bb84 import BB84Protocol, get_backend
+from eavesdropper import Eve
+
+def run_session(key_length, backend, eve_fraction, seed):
+    # Returns (transmission seconds, post-processing seconds) for one seeded round
+    start = time.perf_counter()
+    bb84 = BB84Protocol(key_length, backend=backend, seed=seed)
+    qubits = bb84.alice.prepare_qubits()
+    intercepted = None
+    if eve_fraction > 0:
+        eve = Eve(backend=backend, interception_fraction=eve_fraction, rng=bb84.rng)
+        intercepted = eve.intercept_and_resend(qubits)
+    bb84.execute(intercepted)
+    transmitted = time.perf_counter()
+
+    # Attacked rounds fail the QBER check, so this is only Cascade and Toeplitz for clean ones
+    bb84.get_final_key()
+    return transmitted - start, time.perf_counter() - transmitted, bb84
+
+def main():
+    parser = argparse.ArgumentParser(description='BB84Protocol.execute across key lengths, with and without Eve')
+    parser.add_argument('--key-lengths', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--eve-fractions', type=float, nargs='+', default=[0.0, 1.0])
+    parser.add_argument('--backends', nargs='+', default=['numpy'], choices=['numpy', 'qiskit'])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    results = []
+    for backend_name in args.backends:
+        backend = get_backend(backend_name)
+        for key_length in args.key_lengths:
+            for fraction in args.eve_fractions:
+                run_session(min(key_length, 1000), backend, fraction, args.seed)
+                rounds = [run_session(key_length, backend, fraction, args.seed + i) for i in range(args.repeat)]
+                execute = [r[0] for r in rounds]
+                post = [r[1] for r in rounds]
+                last = rounds[-1][2]
+
+                results.append({
+                    'name': f'bb84/{backend_name}/n={key_length}/eve={fraction:g}',
+                    'backend': backend_name,
+                    'key_length': key_length,
+                    'eve_fraction': fraction,
+                    'repeat': args.repeat,
+                    'execute_mean': statistics.fmean(execute),
+                    'execute_min': min(execute),
+                    'final_key_mean': statistics.fmean(post),
+                    'qber': last.calculate_qber(),
+                    'final_key_length': len(last.get_final_key()),
+                    'ops_per_sec': key_length / statistics.fmean(execute)
+                })
+                r = results[-1]
+                print(f"{backend_name:>6} n={key_length:<8} eve={fraction:<4g} execute={r['execute_mean'] * 1000:9.2f} ms "
+                      f"final_key={r['final_key_mean'] * 1000:9.2f} ms  {r['ops_per_sec']:12.0f} qubits/s")
+
+    print(f"wrote {write_results('bb84', results, args.output)}")
+
+if __name__ == '__main__':
+    main()
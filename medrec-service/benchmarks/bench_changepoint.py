@@ -0,0 +1,71 @@
+import argparse
+import time
+import numpy as np
+from harness import write_results
+from bb84 import BB84Protocol
+from changepoint import ChangePointDetector
+from eavesdropper import Eve
+
+def run_round(key_length, chunk_size, fraction, rng, detector=None):
+    bb84 = BB84Protocol(key_length, rng=rng, chunk_size=chunk_size)
+    eve = Eve(interception_fraction=fraction, rng=rng) if fraction > 0 else None
+
+    start = time.perf_counter()
+    for _ in bb84.execute_stream(eve=eve, detector=detector):
+        pass
+    return bb84, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description='Streaming CUSUM/SPRT eavesdropping detection vs Eve interception fraction')
+    parser.add_argument('--key-length', type=int, default=200000)
+    parser.add_argument('--chunk-size', type=int, default=1024)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--fractions', type=float, nargs='+', default=[0.0, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    results = []
+    for fraction in args.fractions:
+        latencies, transmitted, streamed_times, full_times, qbers = [], [], [], [], []
+        alarms = 0
+        for _ in range(args.rounds):
+            detector = ChangePointDetector()
+            bb84, elapsed = run_round(args.key_length, args.chunk_size, fraction, rng, detector)
+            streamed_times.append(elapsed)
+            transmitted.append(bb84.qubits_transmitted)
+            if detector.alarm is not None:
+                alarms += 1
+                latencies.append(detector.detection_latency())
+
+            # Session-level detection only sees the QBER once the whole round has been simulated
+            full, elapsed = run_round(args.key_length, args.chunk_size, fraction, rng)
+            full_times.append(elapsed)
+            qbers.append(full.calculate_qber())
+
+        results.append({
+            'interception_fraction': fraction,
+            'key_length': args.key_length,
+            'chunk_size': args.chunk_size,
+            'rounds': args.rounds,
+            'mean_session_qber': float(np.mean(qbers)),
+            'detection_rate': alarms / args.rounds,
+            'latency_bits_mean': float(np.mean(latencies)) if latencies else None,
+            'latency_bits_p95': float(np.percentile(latencies, 95)) if latencies else None,
+            'qubits_transmitted_mean': float(np.mean(transmitted)),
+            'round_time_streaming': float(np.mean(streamed_times)),
+            'round_time_full': float(np.mean(full_times)),
+            'simulation_saved': 1 - float(np.mean(streamed_times)) / float(np.mean(full_times))
+        })
+
+    for r in results:
+        latency = f"{r['latency_bits_mean']:>9.1f}" if r['latency_bits_mean'] is not None else '        -'
+        print(f"fraction={r['interception_fraction']:>5.2f} qber={r['mean_session_qber']:>6.2f}% "
+              f"detected={r['detection_rate']:>5.0%} latency_bits={latency} "
+              f"qubits_sent={r['qubits_transmitted_mean']:>9.0f} saved={r['simulation_saved']:>6.1%}")
+
+    print('wrote', write_results('changepoint', results, args.output))
+
+if __name__ == '__main__':
+    main()
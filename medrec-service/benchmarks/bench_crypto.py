@@ -0,0 +1,51 @@
+import argparse
+from harness import measure, write_results
+from encryption import QuantumEncryption, serialize_record
+from medical_data import get_all_records
+
+def sized_record(template, size):
+    # A real record with its notes padded so the serialized payload is about `size` bytes
+    record = dict(template, notes='')
+    padding = max(size - len(serialize_record(record)), 0)
+    return dict(record, notes='x' * padding)
+
+def main():
+    parser = argparse.ArgumentParser(description='QuantumEncryption.encrypt/decrypt across record sizes')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[256, 4096, 65536, 1048576])
+    parser.add_argument('--bytes-per-run', type=int, default=16 * 1024 * 1024)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    crypto = QuantumEncryption()
+    crypto.set_quantum_key([1, 0] * 128)
+    template = get_all_records()[0]
+
+    results = []
+    for size in args.sizes:
+        record = sized_record(template, size)
+        envelope = crypto.encrypt(record)
+        # Enough calls per run that small records are not dominated by timer resolution
+        calls = max(10, min(20000, args.bytes_per_run // size))
+
+        for operation, fn in (('encrypt', lambda: crypto.encrypt(record)), ('decrypt', lambda: crypto.decrypt(envelope))):
+            timing = measure(lambda: [fn() for _ in range(calls)], repeat=args.repeat)
+            per_call = timing['mean'] / calls
+            results.append({
+                'name': f'crypto/{operation}/size={size}',
+                'operation': operation,
+                'record_size': size,
+                'envelope_size': len(envelope),
+                'calls': calls,
+                'time': timing,
+                'us_per_call': per_call * 1e6,
+                'mb_per_sec': size / per_call / 1e6,
+                'ops_per_sec': 1 / per_call
+            })
+            r = results[-1]
+            print(f"{operation:>7} size={size:<8} {r['us_per_call']:10.1f} us/call {r['mb_per_sec']:9.1f} MB/s")
+
+    print(f"wrote {write_results('crypto', results, args.output)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+import argparse
+import json
+from datetime import datetime
+from harness import measure, write_results
+from Crypto.Cipher import AES
+from encryption import QuantumEncryption, envelope_to_json
+from medical_data import get_all_records
+
+def legacy_encrypt(key, data):
+    # Original QuantumEncryption.encrypt: new cipher per call, hex-encoded fields
+    cipher = AES.new(key, AES.MODE_GCM)
+    ciphertext, tag = cipher.encrypt_and_digest(json.dumps(data).encode())
+    return {
+        'ciphertext': ciphertext.hex(),
+        'nonce': cipher.nonce.hex(),
+        'tag': tag.hex(),
+        'encrypted_at': datetime.now().isoformat()
+    }
+
+def legacy_decrypt(key, encrypted_data):
+    cipher = AES.new(key, AES.MODE_GCM, nonce=bytes.fromhex(encrypted_data['nonce']))
+    return cipher.decrypt_and_verify(
+        bytes.fromhex(encrypted_data['ciphertext']),
+        bytes.fromhex(encrypted_data['tag'])
+    ).decode()
+
+def main():
+    parser = argparse.ArgumentParser(description='encrypt_batch throughput: hex dicts vs binary envelopes')
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    crypto = QuantumEncryption()
+    crypto.set_quantum_key([1, 0] * 128)
+    sample = get_all_records()
+    records = [sample[i % len(sample)] for i in range(args.batch_size)]
+
+    legacy = [legacy_encrypt(crypto.key, r) for r in records]
+    envelopes = [crypto.encrypt(r) for r in records]
+
+    results = []
+    for mode, encrypt, decrypt, stored, wire in [
+        ('legacy_hex', lambda r: legacy_encrypt(crypto.key, r), lambda e: legacy_decrypt(crypto.key, e),
+         legacy, [json.dumps(e) for e in legacy]),
+        ('binary_envelope', crypto.encrypt, crypto.decrypt,
+         envelopes, [json.dumps(envelope_to_json(e)) for e in envelopes]),
+    ]:
+        enc = measure(lambda: [encrypt(r) for r in records], repeat=args.repeat)
+        dec = measure(lambda: [decrypt(e) for e in stored], repeat=args.repeat)
+        stored_bytes = sum(len(e) if isinstance(e, bytes) else len(json.dumps(e)) for e in stored) / len(stored)
+        results.append({
+            'mode': mode,
+            'batch_size': args.batch_size,
+            'encrypt_records_per_sec': args.batch_size / enc['mean'],
+            'decrypt_records_per_sec': args.batch_size / dec['mean'],
+            'stored_bytes_per_record': stored_bytes,
+            'wire_bytes_per_record': sum(len(w) for w in wire) / len(wire),
+            'encrypt_time': enc,
+            'decrypt_time': dec
+        })
+
+    for r in results:
+        print(f"{r['mode']:>16} enc/s={r['encrypt_records_per_sec']:>10.0f} dec/s={r['decrypt_records_per_sec']:>10.0f} "
+              f"stored B/rec={r['stored_bytes_per_record']:>7.1f} wire B/rec={r['wire_bytes_per_record']:>7.1f}")
+
+    print('wrote', write_results('envelopes', results, args.output))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import argparse
+import os
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from harness import latency_summary, write_results
+
+def scenarios(patient_ids):
+    # name -> (method, path, json body, headers); the conditional status poll sends the current ETag
+    return {
+        'generate_pool': ('POST', '/api/qkd/generate', {'key_length': 100}, None),
+        'generate_live': ('POST', '/api/qkd/generate', {'key_length': 10000}, None),
+        'encrypt_batch': ('POST', '/api/records/encrypt-batch', {'patient_ids': patient_ids}, None),
+        'security_status': ('GET', '/api/security/status', None, None),
+        'security_status_etag': ('GET', '/api/security/status', None, 'etag')
+    }
+
+def timed_request(client, method, path, body, headers):
+    start = time.perf_counter()
+    response = client.open(path, method=method, json=body, headers=headers)
+    response.get_data()
+    return time.perf_counter() - start, response.status_code
+
+def run_scenario(app, name, scenario, requests, threads):
+    method, path, body, headers = scenario
+    if headers == 'etag':
+        headers = {'If-None-Match': app.test_client().get(path).headers['ETag']}
+
+    def worker(count):
+        client = app.test_client()
+        return [timed_request(client, method, path, body, headers) for _ in range(count)]
+
+    shares = [requests // threads + (1 if i < requests % threads else 0) for i in range(threads)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        samples = [sample for chunk in pool.map(worker, shares) for sample in chunk]
+    elapsed = time.perf_counter() - start
+
+    return {
+        'name': f'http/{name}/threads={threads}',
+        'scenario': name,
+        'method': method,
+        'path': path,
+        'threads': threads,
+        'requests': requests,
+        'elapsed': elapsed,
+        'status_codes': {str(code): count for code, count in Counter(code for _, code in samples).items()},
+        'latency': latency_summary([latency for latency, _ in samples]),
+        'ops_per_sec': requests / elapsed
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='In-process Flask test-client load over the hot HTTP endpoints')
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--scenarios', nargs='+')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    # The app opens its vault and time series at import, so point them at a scratch directory first
+    data_dir = tempfile.mkdtemp(prefix='medrec-bench-')
+    os.environ.setdefault('MEDREC_VAULT_DIR', os.path.join(data_dir, 'vault'))
+    os.environ.setdefault('MEDREC_TIMESERIES_PATH', os.path.join(data_dir, 'metrics.sqlite3'))
+    import app as service
+    from medical_data import get_all_records
+
+    records = get_all_records()
+    patient_ids = [records[i % len(records)]['patient_id'] for i in range(args.batch_size)]
+    selected = scenarios(patient_ids)
+    if args.scenarios:
+        selected = {name: selected[name] for name in args.scenarios}
+
+    results = []
+    try:
+        # Installs a key and starts the key pool and event bus, as the first real request would
+        service.app.test_client().post('/api/qkd/generate', json={'key_length': 1000})
+        for name, scenario in selected.items():
+            for threads in args.threads:
+                result = run_scenario(service.app, name, scenario, args.requests, threads)
+                results.append(result)
+                latency = result['latency']
+                print(f"{name:<22} threads={threads:<3} {result['ops_per_sec']:9.1f} req/s  "
+                      f"p50={latency['p50_ms']:8.2f} ms  p99={latency['p99_ms']:8.2f} ms  {result['status_codes']}")
+    finally:
+        service.key_pool.stop()
+        service.event_bus.stop()
+        service.qkd_jobs.shutdown()
+
+    print(f"wrote {write_results('http', results, args.output)}")
+
+if __name__ == '__main__':
+    main()
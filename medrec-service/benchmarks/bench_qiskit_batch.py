@@ -0,0 +1,81 @@
+import argparse
+import numpy as np
+from harness import measure, write_results
+from qiskit import QuantumCircuit, transpile
+from qiskit_aer import Aer
+from bb84 import BB84Protocol, QiskitBackend
+
+def legacy_measure(simulator, qubits, bases):
+    # Original Bob.measure_qubits: one transpile + run per qubit
+    outcomes = []
+    for i in range(len(qubits)):
+        circuit = QuantumCircuit(1, 1)
+        if qubits.bits[i] == 1:
+            circuit.x(0)
+        if qubits.bases[i] == 1:
+            circuit.h(0)
+        if bases[i] == 1:
+            circuit.h(0)
+        circuit.measure(0, 0)
+
+        job = simulator.run(transpile(circuit, simulator), shots=1)
+        counts = job.result().get_counts(circuit)
+        outcomes.append(int(list(counts.keys())[0]))
+    return outcomes
+
+def bench_legacy(key_lengths, repeat):
+    simulator = Aer.get_backend('qasm_simulator')
+    results = []
+    for key_length in key_lengths:
+        bb84 = BB84Protocol(key_length)
+        qubits = bb84.alice.prepare_qubits()
+        timing = measure(lambda: legacy_measure(simulator, qubits, bb84.bob.bases), repeat=repeat, warmup=0)
+        results.append({
+            'mode': 'per_qubit',
+            'key_length': key_length,
+            'circuits': key_length,
+            'circuits_per_sec': key_length / timing['mean'],
+            'qubits_per_sec': key_length / timing['mean'],
+            'time': timing
+        })
+    return results
+
+def bench_batched(key_lengths, repeat, chunk_size):
+    backend = QiskitBackend(chunk_size=chunk_size)
+    results = []
+    for key_length in key_lengths:
+        bb84 = BB84Protocol(key_length, backend=backend)
+        qubits = bb84.alice.prepare_qubits()
+        circuits = int(np.ceil(key_length / chunk_size))
+        timing = measure(lambda: backend.measure(qubits, bb84.bob.bases, bb84.bob.rng), repeat=repeat)
+        results.append({
+            'mode': 'batched',
+            'chunk_size': chunk_size,
+            'key_length': key_length,
+            'circuits': circuits,
+            'circuits_per_sec': circuits / timing['mean'],
+            'qubits_per_sec': key_length / timing['mean'],
+            'time': timing
+        })
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-qubit vs batched Qiskit measurement throughput')
+    parser.add_argument('--legacy-lengths', type=int, nargs='+', default=[16, 64])
+    parser.add_argument('--key-lengths', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--chunk-size', type=int, default=128)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    results = bench_legacy(args.legacy_lengths, args.repeat)
+    results += bench_batched(args.key_lengths, args.repeat, args.chunk_size)
+
+    for r in results:
+        print(f"{r['mode']:>10} n={r['key_length']:>7} circuits/s={r['circuits_per_sec']:>10.1f} "
+              f"qubits/s={r['qubits_per_sec']:>12.1f} mean={r['time']['mean']:.4f}s")
+
+    print('wrote', write_results('qiskit_batch', results, args.output))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+import argparse
+import numpy as np
+from harness import measure, write_results
+from medical_data import RecordStore, get_all_records
+
+# Substrings of varying selectivity: a common diagnosis, a rare name fragment, a miss and a
+# query too short for the trigram index
+QUERIES = ('diabetes', 'smi', 'zzzz', 'p0')
+
+def synthetic_store(size, seed):
+    templates = get_all_records()
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(templates), size)
+    return RecordStore(
+        dict(templates[pick], patient_id=f'P{i:07d}', name=f"{templates[pick]['name']} {i}")
+        for i, pick in enumerate(picks)
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description='RecordStore.search across store sizes')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--queries', nargs='+', default=list(QUERIES))
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--calls', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        store = synthetic_store(size, args.seed)
+        for query in args.queries:
+            matches, _ = store.search(query)
+            # Paged, as the /api/records/search endpoint serves it
+            timing = measure(lambda: [store.search(query, 0, args.limit) for _ in range(args.calls)], repeat=3)
+            per_call = timing['mean'] / args.calls
+            results.append({
+                'name': f'search/size={size}/q={query}',
+                'store_size': size,
+                'query': query,
+                'matches': matches,
+                'limit': args.limit,
+                'time': timing,
+                'us_per_call': per_call * 1e6,
+                'ops_per_sec': 1 / per_call
+            })
+            print(f"size={size:<8} q={query!r:<12} matches={matches:<8} {results[-1]['us_per_call']:10.1f} us/query")
+
+    print(f"wrote {write_results('search', results, args.output)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+import argparse
+import http.client
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import tempfile
+import time
+from harness import write_results
+
+# Pre-fork layout like a sync Gunicorn deployment: the parent binds one listening socket and
+# every worker process accepts on it. Workers import the app after forking, so each has its
+# own process-local state unless the state backend is shared
+REQUESTS = (
+    ('GET', '/api/security/status', None),
+    ('POST', '/api/records/encrypt', {'patient_id': 'P001'}),
+    ('POST', '/api/records/decrypt', {'patient_id': 'P001'}),
+    ('GET', '/api/key/history', None)
+)
+
+def serve(listener, data_dir, backend, ready):
+    # An unshared vault must not have several writers, so process-local workers each get their own
+    vault = 'vault' if backend != 'memory' else f'vault-{os.getpid()}'
+    os.environ['MEDREC_VAULT_DIR'] = os.path.join(data_dir, vault)
+    os.environ['MEDREC_TIMESERIES_PATH'] = os.path.join(data_dir, f'metrics-{os.getpid()}.sqlite3')
+    os.environ['MEDREC_STATE_BACKEND'] = backend
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    from werkzeug.serving import make_server
+    import app
+
+    server = make_server('127.0.0.1', listener.getsockname()[1], app.app, fd=listener.fileno())
+    ready.release()
+    server.serve_forever()
+
+def request(port, method, path, body=None):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    try:
+        payload = json.dumps(body) if body is not None else None
+        connection.request(method, path, payload, {'Content-Type': 'application/json'} if payload else {})
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    finally:
+        connection.close()
+
+def client(port, duration, results):
+    completed = errors = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        for method, path, body in REQUESTS:
+            if request(port, method, path, body) >= 500:
+                errors += 1
+            completed += 1
+    results.put((completed, errors))
+
+def run(workers, clients, duration, backend, context):
+    with tempfile.TemporaryDirectory() as data_dir:
+        backend_url = 'memory' if backend == 'memory' else f'sqlite:///{os.path.join(data_dir, "state.sqlite3")}'
+        listener = socket.create_server(('127.0.0.1', 0), backlog=256)
+        port = listener.getsockname()[1]
+
+        ready = context.Semaphore(0)
+        servers = [context.Process(target=serve, args=(listener, data_dir, backend_url, ready), daemon=True) for _ in range(workers)]
+        for server in servers:
+            server.start()
+        for _ in servers:
+            ready.acquire()
+
+        try:
+            # Install a key and one record so every request has something to work on
+            request(port, 'POST', '/api/qkd/generate', {'key_length': 512})
+            request(port, 'POST', '/api/records/encrypt', {'patient_id': 'P001'})
+
+            results = context.Queue()
+            start = time.perf_counter()
+            load = [context.Process(target=client, args=(port, duration, results)) for _ in range(clients)]
+            for process in load:
+                process.start()
+            totals = [results.get() for _ in load]
+            for process in load:
+                process.join()
+            elapsed = time.perf_counter() - start
+        finally:
+            for server in servers:
+                server.terminate()
+                server.join()
+            listener.close()
+
+    completed = sum(done for done, _ in totals)
+    return {
+        'backend': backend,
+        'workers': workers,
+        'clients': clients,
+        'requests': completed,
+        'errors': sum(errors for _, errors in totals),
+        'elapsed': elapsed,
+        'requests_per_sec': completed / elapsed
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Request throughput vs pre-forked worker count per state backend')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--backends', nargs='+', default=['memory', 'sqlite'], choices=['memory', 'sqlite'])
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('fork')
+    results = []
+    for backend in args.backends:
+        for workers in args.workers:
+            result = run(workers, args.clients, args.duration, backend, context)
+            results.append(result)
+            print(f"{backend:>6}  workers={workers:<3} {result['requests_per_sec']:8.1f} req/s  errors={result['errors']}")
+
+    # With the memory backend each worker only sees its own key and Eve settings; the numbers
+    # show the cost of sharing, not a consistent deployment
+    path = write_results('workers', results, args.output)
+    print(f'Results written to {path} ({os.cpu_count()} CPUs)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+import argparse
+import sys
+from harness import load_results
+
+def named_results(payload):
+    # Accepts a single benchmark file or a run_all suite file; entries without a name are skipped
+    results = payload['results']
+    if isinstance(results, dict) and 'suites' in results:
+        results = [entry for entries in results['suites'].values() for entry in entries]
+    return {entry['name']: entry for entry in results if 'name' in entry and 'ops_per_sec' in entry}
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare ops/sec between two benchmark result files')
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Relative slowdown reported as a regression')
+    args = parser.parse_args()
+
+    baseline_payload, candidate_payload = load_results(args.baseline), load_results(args.candidate)
+    baseline, candidate = named_results(baseline_payload), named_results(candidate_payload)
+    print(f"baseline {baseline_payload.get('commit')}  candidate {candidate_payload.get('commit')}")
+
+    regressions = 0
+    for name in sorted(baseline.keys() & candidate.keys()):
+        before, after = baseline[name]['ops_per_sec'], candidate[name]['ops_per_sec']
+        change = after / before - 1
+        flag = ''
+        if change < -args.threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        elif change > args.threshold:
+            flag = '  faster'
+        print(f'{name:<50} {before:14.1f} -> {after:14.1f} ops/s {change:+8.1%}{flag}')
+
+    for name in sorted(baseline.keys() - candidate.keys()):
+        print(f'{name:<50} only in baseline')
+    for name in sorted(candidate.keys() - baseline.keys()):
+        print(f'{name:<50} only in candidate')
+
+    sys.exit(1 if regressions else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(SERVICE_DIR, 'benchmarks', 'results')
+
+# Benchmarks are run as scripts from anywhere, so make the service modules importable
+if SERVICE_DIR not in sys.path:
+    sys.path.insert(0, SERVICE_DIR)
+
+def measure(fn, repeat=5, warmup=1):
+    for _ in range(warmup):
+        fn()
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+
+    return {
+        'min': min(samples),
+        'mean': statistics.fmean(samples),
+        'max': max(samples),
+        'repeat': repeat
+    }
+
+def latency_summary(samples):
+    # Per-operation latencies (seconds) summarized in milliseconds
+    ms = sorted(sample * 1000 for sample in samples)
+    cuts = statistics.quantiles(ms, n=100, method='inclusive') if len(ms) > 1 else ms * 99
+    return {
+        'count': len(ms),
+        'mean_ms': statistics.fmean(ms),
+        'p50_ms': cuts[49],
+        'p95_ms': cuts[94],
+        'p99_ms': cuts[98],
+        'max_ms': ms[-1]
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=SERVICE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def write_results(name, results, output=None):
+    payload = {
+        'benchmark': name,
+        'timestamp': datetime.now().isoformat(),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'results': results
+    }
+
+    path = output or os.path.join(RESULTS_DIR, f'{name}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(payload, f, indent=2)
+    return path
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,41 @@
+import argparse
+import os
+import subprocess
+import sys
+from harness import RESULTS_DIR, git_commit, load_results, write_results
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Suite name -> (script, full arguments, --quick arguments). Each runs in its own interpreter so
+# one suite's imports and allocations never skew the next
+SUITES = {
+    'bb84': ('bench_bb84.py', [], ['--key-lengths', '1000', '100000', '--repeat', '3']),
+    'crypto': ('bench_crypto.py', [], ['--sizes', '256', '65536', '--repeat', '3']),
+    'analytics': ('bench_analytics.py', [], ['--sessions', '100000', '--reads', '200']),
+    'search': ('bench_search.py', [], ['--sizes', '1000', '10000', '--calls', '20']),
+    'http': ('bench_http.py', [], ['--requests', '100'])
+}
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the benchmark suites and collect their results in one JSON file')
+    parser.add_argument('--suites', nargs='+', choices=list(SUITES), default=list(SUITES))
+    parser.add_argument('--quick', action='store_true', help='Smaller sizes, for a fast before/after check')
+    parser.add_argument('--output', help='Defaults to results/suite-<commit>.json')
+    args = parser.parse_args()
+
+    suites = {}
+    for name in args.suites:
+        script, full, quick = SUITES[name]
+        path = os.path.join(RESULTS_DIR, f'{name}.json')
+        print(f'== {name}', flush=True)
+        subprocess.run(
+            [sys.executable, os.path.join(BENCHMARK_DIR, script), *(quick if args.quick else full), '--output', path],
+            check=True
+        )
+        suites[name] = load_results(path)['results']
+
+    output = args.output or os.path.join(RESULTS_DIR, f"suite-{git_commit() or 'unknown'}.json")
+    print(f"wrote {write_results('suite', {'quick': args.quick, 'suites': suites}, output)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+import numpy as np
+
+def error_indicators(sifted_alice, sifted_bob):
+    # One uint8 per sifted bit, 1 where Bob's bit disagrees with Alice's
+    return np.unpackbits(np.bitwise_xor(sifted_alice.data, sifted_bob.data), count=len(sifted_alice))
+
+class BernoulliCUSUM:
+    # Page's CUSUM on the per-bit log-likelihood ratio of QBER p1 (attack) against p0 (clean channel)
+    def __init__(self, p0=0.05, p1=0.11, threshold=15.0):
+        # Per-bit log-likelihood ratio, indexed by the error indicator
+        self.llr = np.array([np.log((1 - p1) / (1 - p0)), np.log(p1 / p0)])
+        self.threshold = threshold
+        self.statistic = 0.0
+
+    def update(self, errors):
+        # Returns the offset of the first bit at which the statistic crosses the threshold, or None.
+        # S_t = max(0, S_{t-1} + x_t) is evaluated for the whole chunk as C_t - min(0, min C_s)
+        if len(errors) == 0:
+            return None
+        cumulative = self.statistic + np.cumsum(self.llr[errors])
+        statistic = cumulative - np.minimum(np.minimum.accumulate(cumulative), 0.0)
+
+        crossed = np.flatnonzero(statistic >= self.threshold)
+        if len(crossed):
+            self.statistic = float(statistic[crossed[0]])
+            return int(crossed[0])
+        self.statistic = float(statistic[-1])
+        return None
+
+    def reset(self):
+        self.statistic = 0.0
+
+class SequentialRatioTest:
+    # Wald's SPRT of H0: QBER = p0 against H1: QBER = p1. Once it accepts H0 the channel is
+    # considered clean for the round and later changes are left to the CUSUM
+    def __init__(self, p0=0.05, p1=0.11, alpha=1e-3, beta=1e-3):
+        # Per-bit log-likelihood ratio, indexed by the error indicator
+        self.llr = np.array([np.log((1 - p1) / (1 - p0)), np.log(p1 / p0)])
+        self.upper = np.log((1 - beta) / alpha)
+        self.lower = np.log(beta / (1 - alpha))
+        self.statistic = 0.0
+        self.decision = None
+
+    def update(self, errors):
+        # Returns the offset of the bit at which H1 is accepted, or None
+        if self.decision is not None or len(errors) == 0:
+            return None
+        cumulative = self.statistic + np.cumsum(self.llr[errors])
+        outside = np.flatnonzero((cumulative >= self.upper) | (cumulative <= self.lower))
+        if len(outside) == 0:
+            self.statistic = float(cumulative[-1])
+            return None
+
+        position = int(outside[0])
+        self.statistic = float(cumulative[position])
+        if self.statistic >= self.upper:
+            self.decision = 'h1'
+            return position
+        self.decision = 'h0'
+        return None
+
+    def reset(self):
+        self.statistic = 0.0
+        self.decision = None
+
+class ChangePointDetector:
+    # Streams sifted-bit error indicators through CUSUM and SPRT; the first to alarm wins.
+    # p0 is the warning QBER the channel is allowed to run at, p1 the 11% abort threshold. The
+    # CUSUM threshold is set high so that a clean channel sees ~1e6 bits between false alarms
+    def __init__(self, p0=0.05, p1=0.11, alpha=1e-3, beta=1e-3, cusum_threshold=15.0):
+        self.p0 = p0
+        self.p1 = p1
+        self.sprt = SequentialRatioTest(p0, p1, alpha, beta)
+        self.cusum = BernoulliCUSUM(p0, p1, cusum_threshold)
+        self.bits_seen = 0
+        self.errors_seen = 0
+        self.alarm = None
+
+    def update(self, errors):
+        # Returns the alarm dict the first time either test fires, otherwise None
+        if self.alarm is not None:
+            return self.alarm
+
+        errors = np.asarray(errors, dtype=np.uint8)
+        hits = [(offset, method) for offset, method in (
+            (self.cusum.update(errors), 'cusum'),
+            (self.sprt.update(errors), 'sprt')
+        ) if offset is not None]
+
+        if hits:
+            offset, method = min(hits)
+            self.alarm = {
+                'method': method,
+                'detected_at_bit': self.bits_seen + offset + 1,
+                'errors_at_detection': self.errors_seen + int(np.count_nonzero(errors[:offset + 1])),
+                'cusum_statistic': round(self.cusum.statistic, 4),
+                'sprt_statistic': round(self.sprt.statistic, 4)
+            }
+            self.alarm['qber_at_detection'] = self.alarm['errors_at_detection'] / self.alarm['detected_at_bit'] * 100
+
+        self.bits_seen += len(errors)
+        self.errors_seen += int(np.count_nonzero(errors))
+        return self.alarm
+
+    def detection_latency(self, onset_bit=0):
+        # Sifted bits between the attack onset and the alarm
+        if self.alarm is None:
+            return None
+        return max(self.alarm['detected_at_bit'] - onset_bit, 0)
+
+    def reset(self):
+        self.cusum.reset()
+        self.sprt.reset()
+        self.bits_seen = 0
+        self.errors_seen = 0
+        self.alarm = None
+
+    def get_stats(self):
+        return {
+            'p0': self.p0,
+            'p1': self.p1,
+            'bits_seen': self.bits_seen,
+            'errors_seen': self.errors_seen,
+            'cusum_statistic': round(self.cusum.statistic, 4),
+            'sprt_statistic': round(self.sprt.statistic, 4),
+            'sprt_decision': self.sprt.decision,
+            'alarm': self.alarm
+        }
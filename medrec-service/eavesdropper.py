@@ -1,59 +1,59 @@
-import random
-from qiskit import QuantumCircuit, transpile
-from qiskit_aer import Aer
+import numpy as np
+from bb84 import QubitStates, get_backend
+from instrumentation import metrics
+
+INTERCEPT_SECONDS = metrics.histogram('medrec_eve_intercept_seconds', "Eve's intercept-and-resend of one batch of qubits")
 
 class Eve:
-    def __init__(self, attack_strategy: str = "random"):
-        self.backend = Aer.get_backend("qasm_simulator")
-        self.intercepted_bits = []
-        self.bases_used = []
+    def __init__(self, attack_strategy: str = "random", backend="numpy", interception_fraction: float = 1.0, rng=None):
+        self.backend = get_backend(backend)
+        # Pass the session's generator so an attacked round replays from the session seed
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.intercepted_bits = np.empty(0, dtype=np.uint8)
+        self.bases_used = np.empty(0, dtype=np.uint8)
         self.attack_strategy = attack_strategy
+        self.interception_fraction = min(max(float(interception_fraction), 0.0), 1.0)
         self.successful_intercepts = 0
+        # Totals accumulate across calls so chunked (streamed) rounds report the whole attack
+        self.qubits_intercepted = 0
+        self.x_basis_used = 0
 
-    def intercept_and_resend(self, qubits):
-        intercepted_qubits = []
-        self.intercepted_bits = []
-        self.bases_used = []
-        self.successful_intercepts = 0
-
-        for qc in qubits:
-            if self.attack_strategy == "random":
-                eve_basis = random.choice(["Z", "X"])
-            elif self.attack_strategy == "z_only":
-                eve_basis = "Z"
-            elif self.attack_strategy == "x_only":
-                eve_basis = "X"
-            else:
-                eve_basis = random.choice(["Z", "X"])
-
-            self.bases_used.append(eve_basis)
-
-            measure_circuit = qc.copy()
-            if eve_basis == "X":
-                measure_circuit.h(0)
-            measure_circuit.measure(0, 0)
+    def choose_bases(self, n):
+        if self.attack_strategy == "z_only":
+            return np.zeros(n, dtype=np.uint8)
+        if self.attack_strategy == "x_only":
+            return np.ones(n, dtype=np.uint8)
+        return self.rng.integers(0, 2, n, dtype=np.uint8)
 
-            job = self.backend.run(transpile(measure_circuit, self.backend), shots=1)
-            result = job.result()
-            counts = result.get_counts(measure_circuit)
-            measured_bit = int(list(counts.keys())[0])
-
-            self.intercepted_bits.append(measured_bit)
-
-            new_qc = QuantumCircuit(1, 1)
-            if measured_bit == 1:
-                new_qc.x(0)
-            if eve_basis == "X":
-                new_qc.h(0)
-
-            intercepted_qubits.append(new_qc)
-
-        return intercepted_qubits
+    def intercept_and_resend(self, qubits):
+        with INTERCEPT_SECONDS.time():
+            return self._intercept_and_resend(qubits)
+
+    def _intercept_and_resend(self, qubits):
+        if self.interception_fraction >= 1.0:
+            intercepted = np.ones(len(qubits), dtype=bool)
+        else:
+            intercepted = self.rng.random(len(qubits)) < self.interception_fraction
+
+        targets = QubitStates(qubits.bits[intercepted], qubits.bases[intercepted])
+        self.bases_used = self.choose_bases(len(targets))
+        self.intercepted_bits = self.backend.measure(targets, self.bases_used, self.rng)
+        self.successful_intercepts += int(np.count_nonzero(self.bases_used == targets.bases))
+        self.qubits_intercepted += len(targets)
+        self.x_basis_used += int(np.count_nonzero(self.bases_used))
+
+        # The collapsed qubit is resent in the basis Eve measured it in; the rest pass untouched
+        resent_bits = qubits.bits.copy()
+        resent_bases = qubits.bases.copy()
+        resent_bits[intercepted] = self.intercepted_bits
+        resent_bases[intercepted] = self.bases_used
+
+        return QubitStates(resent_bits, resent_bases)
 
     def get_attack_stats(self):
         return {
             "strategy": self.attack_strategy,
-            "qubits_intercepted": len(self.intercepted_bits),
-            "z_basis_used": self.bases_used.count("Z"),
-            "x_basis_used": self.bases_used.count("X"),
+            "qubits_intercepted": self.qubits_intercepted,
+            "z_basis_used": self.qubits_intercepted - self.x_basis_used,
+            "x_basis_used": self.x_basis_used,
         }
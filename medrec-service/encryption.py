@@ -1,69 +1,234 @@
 from Crypto.Cipher import AES
 from Crypto.Random import get_random_bytes
+import base64
 import hashlib
 import json
+import struct
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from functools import partial
 from datetime import datetime
+from packed_key import PackedKey
+from instrumentation import metrics
+
+ENCRYPT_SECONDS = metrics.histogram('medrec_aes_encrypt_seconds', 'AES-GCM sealing of one record envelope')
+DECRYPT_SECONDS = metrics.histogram('medrec_aes_decrypt_seconds', 'AES-GCM opening and verification of one record envelope')
+
+KEY_ID = struct.Struct('>I')
+NONCE_SIZE = 12
+TAG_SIZE = 16
+HEADER_SIZE = KEY_ID.size + NONCE_SIZE
+
+# Envelopes are a single binary blob: key_id || nonce || ciphertext || tag. The key id is
+# authenticated as associated data, so it cannot be swapped to point at another key
+# Key ring entries written to a shared state backend are wrapped the same way, with a wrapping
+# key from the environment, so the state file never holds raw AES keys
+KEY_WRAP_AAD = b'medrec-key-ring'
+
+def parse_wrapping_key(value):
+    # 32 bytes, hex encoded (MEDREC_STATE_KEY)
+    try:
+        key = bytes.fromhex(value)
+    except (TypeError, ValueError):
+        key = None
+    if key is None or len(key) != 32:
+        raise ValueError("Key ring wrapping key must be 64 hex characters (32 bytes)")
+    return key
+
+def wrap_key(wrapping_key, key_id, key):
+    nonce = get_random_bytes(NONCE_SIZE)
+    cipher = AES.new(wrapping_key, AES.MODE_GCM, nonce=nonce, mac_len=TAG_SIZE)
+    cipher.update(KEY_WRAP_AAD + KEY_ID.pack(key_id))
+    ciphertext, tag = cipher.encrypt_and_digest(key)
+    return base64.b64encode(nonce + ciphertext + tag).decode('ascii')
+
+def unwrap_key(wrapping_key, key_id, wrapped):
+    blob = base64.b64decode(wrapped)
+    cipher = AES.new(wrapping_key, AES.MODE_GCM, nonce=blob[:NONCE_SIZE], mac_len=TAG_SIZE)
+    cipher.update(KEY_WRAP_AAD + KEY_ID.pack(key_id))
+    return cipher.decrypt_and_verify(blob[NONCE_SIZE:-TAG_SIZE], blob[-TAG_SIZE:])
+
+def envelope_to_json(envelope):
+    return {'envelope': base64.b64encode(envelope).decode('ascii')}
+
+def envelope_from_json(encrypted_data):
+    if isinstance(encrypted_data, (bytes, bytearray, memoryview)):
+        return encrypted_data
+    if 'envelope' not in encrypted_data:
+        raise ValueError("Unsupported envelope format")
+    return base64.b64decode(encrypted_data['envelope'])
+
+def envelope_key_id(envelope):
+    return KEY_ID.unpack_from(envelope)[0]
+
+def serialize_record(data):
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return data
+    if isinstance(data, str):
+        return data.encode()
+    return json.dumps(data, separators=(',', ':')).encode()
 
 class QuantumEncryption:
     def __init__(self):
         self.key = None
+        self.key_id = None
+        # Key ring: key_id -> cipher factory; older keys stay until their records are rotated
+        self.keys = {}
+        # Raw key bytes per id, kept only so the ring can be shared with other worker processes
+        self._key_material = {}
         self.key_generated_at = None
         self.encryption_count = 0
         self.key_history = []
+        # key_id -> sealers still in use; a leased key is never retired
+        self._leases = Counter()
+        self._lease_lock = threading.Lock()
         
     def set_quantum_key(self, quantum_bits):
-        if len(quantum_bits) < 32:
-            quantum_bits.extend([0] * (32 - len(quantum_bits)))
+        if not isinstance(quantum_bits, PackedKey):
+            quantum_bits = PackedKey.from_bits(quantum_bits)
         
-        key_string = ''.join(map(str, quantum_bits[:32]))
-        self.key = hashlib.sha256(key_string.encode()).digest()
+        # Amplified keys of 256+ bits are used directly as the AES-256 key; shorter ones are
+        # stretched with SHA-256 over all of their bits rather than a truncated prefix
+        if len(quantum_bits) >= 256:
+            self.key = quantum_bits[:256].to_bytes()
+            derivation = 'direct'
+        else:
+            self.key = hashlib.sha256(quantum_bits.to_bytes()).digest()
+            derivation = 'sha256'
+        
+        # Ids are a key fingerprint, so envelopes from an earlier process never alias a new key
+        key_hash = hashlib.sha256(self.key).digest()
+        self.key_id = KEY_ID.unpack_from(key_hash)[0]
+        # Everything that depends only on the key is bound once here, not on every call.
+        # PyCryptodome still expands the AES/GHASH tables inside each GCM object it creates
+        self._add_key(self.key_id, self.key)
         self.key_generated_at = datetime.now().isoformat()
         self.encryption_count = 0
         
         self.key_history.append({
             'timestamp': self.key_generated_at,
+            'key_id': self.key_id,
             'key_length': len(quantum_bits),
-            'key_hash': hashlib.sha256(self.key).hexdigest()[:16]
+            'derivation': derivation,
+            'key_hash': key_hash.hex()[:16]
         })
         
         if len(self.key_history) > 10:
             self.key_history.pop(0)
+        
+        return self.key_id
     
-    def encrypt(self, data):
+    def _add_key(self, key_id, key):
+        self.keys[key_id] = partial(AES.new, key, AES.MODE_GCM, mac_len=TAG_SIZE)
+        self._key_material[key_id] = key
+    
+    def export_keys(self, wrapping_key):
+        # JSON-safe copy of the ring for a shared state backend; every key is wrapped
+        return {
+            'key_id': self.key_id,
+            'generated_at': self.key_generated_at,
+            'keys': {str(key_id): wrap_key(wrapping_key, key_id, key) for key_id, key in self._key_material.items()},
+            'key_history': list(self.key_history)
+        }
+    
+    def load_keys(self, exported, wrapping_key):
+        # Replaces the ring with one exported by another process; keys are only unwrapped and
+        # cipher factories only rebuilt for keys this process has not seen yet
+        keys = {
+            int(key_id): self._key_material.get(int(key_id)) or unwrap_key(wrapping_key, int(key_id), key)
+            for key_id, key in exported['keys'].items()
+        }
+        for key_id in list(self.keys):
+            if key_id not in keys and not self._leases[key_id]:
+                del self.keys[key_id]
+                del self._key_material[key_id]
+        for key_id, key in keys.items():
+            if key_id not in self.keys:
+                self._add_key(key_id, key)
+        
+        if exported['key_id'] != self.key_id:
+            self.key_id = exported['key_id']
+            self.key = keys[self.key_id]
+            self.key_generated_at = exported['generated_at']
+            self.encryption_count = 0
+        self.key_history = list(exported['key_history'])
+    
+    def retire_keys(self, keep=()):
+        # Drops every key except the current one and `keep`; their envelopes become unreadable
+        with self._lease_lock:
+            keep = set(keep) | {self.key_id} | {key_id for key_id, count in self._leases.items() if count}
+            retired = [key_id for key_id in list(self.keys) if key_id not in keep]
+            for key_id in retired:
+                del self.keys[key_id]
+                del self._key_material[key_id]
+        return retired
+    
+    @contextmanager
+    def lease(self, on_stale=None):
+        # A sealer for long-running writers (batches): its key stays in the ring until the lease
+        # ends. If the key was superseded meanwhile, `on_stale()` runs before the key is released,
+        # so a follow-up rotation can pick up everything written under it
+        with self._lease_lock:
+            seal = self.sealer()
+            key_id = self.key_id
+            self._leases[key_id] += 1
+        try:
+            yield seal
+        finally:
+            if on_stale is not None and key_id != self.key_id:
+                on_stale()
+            with self._lease_lock:
+                self._leases[key_id] -= 1
+                if not self._leases[key_id]:
+                    del self._leases[key_id]
+    
+    def sealer(self):
+        # Side-effect free encrypt bound to the current key, safe to call from worker threads
         if not self.key:
             raise ValueError("No quantum key set")
         
-        if isinstance(data, dict):
-            data = json.dumps(data)
+        new_cipher = self.keys[self.key_id]
+        header_key_id = KEY_ID.pack(self.key_id)
         
-        cipher = AES.new(self.key, AES.MODE_GCM)
-        ciphertext, tag = cipher.encrypt_and_digest(data.encode())
+        def seal(payload):
+            with ENCRYPT_SECONDS.time():
+                nonce = get_random_bytes(NONCE_SIZE)
+                cipher = new_cipher(nonce=nonce)
+                cipher.update(header_key_id)
+                ciphertext, tag = cipher.encrypt_and_digest(payload)
+                return b''.join((header_key_id, nonce, ciphertext, tag))
         
+        return seal
+    
+    def encrypt(self, data):
+        envelope = self.sealer()(serialize_record(data))
         self.encryption_count += 1
-        
-        return {
-            'ciphertext': ciphertext.hex(),
-            'nonce': cipher.nonce.hex(),
-            'tag': tag.hex(),
-            'encrypted_at': datetime.now().isoformat()
-        }
+        return envelope
     
     def decrypt(self, encrypted_data):
-        if not self.key:
-            raise ValueError("No quantum key set")
+        envelope = memoryview(envelope_from_json(encrypted_data))
+        if len(envelope) < HEADER_SIZE + TAG_SIZE:
+            raise ValueError("Envelope too short")
+        
+        key_id = envelope_key_id(envelope)
+        new_cipher = self.keys.get(key_id)
+        if new_cipher is None:
+            raise ValueError(f"Unknown or retired key id: {key_id}")
         
-        cipher = AES.new(self.key, AES.MODE_GCM, nonce=bytes.fromhex(encrypted_data['nonce']))
-        plaintext = cipher.decrypt_and_verify(
-            bytes.fromhex(encrypted_data['ciphertext']),
-            bytes.fromhex(encrypted_data['tag'])
-        )
+        with DECRYPT_SECONDS.time():
+            cipher = new_cipher(nonce=envelope[KEY_ID.size:HEADER_SIZE])
+            cipher.update(envelope[:KEY_ID.size])
+            plaintext = cipher.decrypt_and_verify(envelope[HEADER_SIZE:-TAG_SIZE], envelope[-TAG_SIZE:])
         
         return plaintext.decode()
     
     def get_key_stats(self):
         return {
             'key_active': self.key is not None,
+            'key_id': self.key_id,
+            'keys_in_ring': len(self.keys),
             'generated_at': self.key_generated_at,
             'encryptions_performed': self.encryption_count,
-            'key_history': self.key_history
+            'key_history': list(self.key_history)
         }
@@ -0,0 +1,142 @@
+import threading
+import time
+from collections import Counter, deque
+from analytics import RunningStats
+from instrumentation import metrics
+
+EMIT_SECONDS = metrics.histogram('medrec_socketio_emit_seconds', 'One Socket.IO emit from the event bus, payload build included')
+
+ACTOR_ROOMS = ('alice', 'bob', 'eve')
+
+# Rooms each event goes to; events not listed here reach every actor
+EVENT_ROUTES = {
+    'key_generated': ACTOR_ROOMS,
+    'security_status_update': ('alice', 'bob'),
+    'data_encrypted': ('bob', 'eve'),
+    'actor_status': ACTOR_ROOMS,
+    'key_rotation_progress': ('bob',),
+    'security_status_delta': ('status',)
+}
+
+# Only the latest state matters for these, so repeats within the window replace each other
+COALESCED_EVENTS = ('security_status_update', 'actor_status', 'key_rotation_progress', 'security_status_delta')
+
+class EventBus:
+    # Outbound Socket.IO fan-out on a background task. Request handlers only enqueue; state
+    # events are coalesced per window, and when the bounded queue is full the oldest event is
+    # dropped and later reported in one aggregated 'events_dropped' notice
+    def __init__(self, socketio, routes=EVENT_ROUTES, coalesced=COALESCED_EVENTS, window=0.25, max_queue=1024):
+        self.socketio = socketio
+        self.routes = routes
+        self.coalesced = set(coalesced)
+        self.window = window
+        self.max_queue = max_queue
+
+        self._queue = deque()
+        self._latest = {}
+        self._dropped_pending = Counter()
+        self._condition = threading.Condition()
+        self._running = False
+
+        self.published = 0
+        self.emitted = 0
+        self.coalesced_count = 0
+        self.dropped = Counter()
+        self.emit_errors = 0
+        self.emit_latency = RunningStats()
+
+    def start(self):
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+        self.socketio.start_background_task(self._run)
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+
+    def publish(self, event, data, to=None):
+        # Never blocks the caller; `to` overrides the routing table with a room or list of rooms.
+        # `data` may be a callable, which is then evaluated on the emitting task
+        item = (event, data, to, time.perf_counter())
+        with self._condition:
+            self.published += 1
+            if event in self.coalesced:
+                key = (event, to if isinstance(to, (str, type(None))) else tuple(to))
+                pending = self._latest.get(key)
+                if pending is not None:
+                    # The window runs from the first pending publish, so a steady stream of updates
+                    # still goes out once per window instead of waiting for the stream to pause
+                    self.coalesced_count += 1
+                    item = item[:3] + (pending[3],)
+                elif not self._latest:
+                    self._condition.notify()
+                self._latest[key] = item
+                return
+
+            if len(self._queue) >= self.max_queue:
+                dropped = self._queue.popleft()
+                self.dropped[dropped[0]] += 1
+                self._dropped_pending[dropped[0]] += 1
+            self._queue.append(item)
+            self._condition.notify()
+
+    def _oldest_pending_age(self):
+        return time.perf_counter() - min(item[3] for item in self._latest.values())
+
+    def _run(self):
+        while True:
+            with self._condition:
+                # Idle until something is queued; coalesced state is held until its window closes
+                while self._running and not self._queue:
+                    if not self._latest:
+                        self._condition.wait()
+                        continue
+                    remaining = self.window - self._oldest_pending_age()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                if not self._running:
+                    return
+
+                batch = list(self._queue)
+                self._queue.clear()
+                if self._latest and self._oldest_pending_age() >= self.window:
+                    batch.extend(self._latest.values())
+                    self._latest = {}
+                dropped, self._dropped_pending = self._dropped_pending, Counter()
+
+            if dropped:
+                self._emit('events_dropped', {'counts': dict(dropped), 'total': sum(dropped.values())}, None)
+            for event, data, to, published_at in batch:
+                self._emit(event, data, to)
+                self.emit_latency.update((time.perf_counter() - published_at) * 1000)
+
+    def _emit(self, event, data, to):
+        rooms = to if to is not None else self.routes.get(event, ACTOR_ROOMS)
+        try:
+            with EMIT_SECONDS.time():
+                if callable(data):
+                    # Payload built at emit time, e.g. a delta covering every coalesced publish
+                    data = data()
+                self.socketio.emit(event, data, to=list(rooms) if isinstance(rooms, tuple) else rooms)
+            self.emitted += 1
+        except Exception:
+            self.emit_errors += 1
+
+    def get_stats(self):
+        return {
+            'running': self._running,
+            'queue_depth': len(self._queue),
+            'pending_coalesced': len(self._latest),
+            'max_queue': self.max_queue,
+            'window': self.window,
+            'published': self.published,
+            'emitted': self.emitted,
+            'coalesced': self.coalesced_count,
+            'dropped': dict(self.dropped),
+            'emit_errors': self.emit_errors,
+            'emit_latency_ms': self.emit_latency.to_dict()
+        }
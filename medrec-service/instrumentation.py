@@ -0,0 +1,146 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+
+# Latency bucket upper bounds in seconds, from 10 microseconds (one AES envelope) to 10 s (a
+# multi-million qubit round)
+LATENCY_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+# Shared no-op returned by time() while instrumentation is disabled
+NULL_TIMER = nullcontext()
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Timer:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+class Histogram:
+    def __init__(self, registry, labels, buckets):
+        self._registry = registry
+        self.labels = labels
+        self.buckets = buckets
+        # One slot per bucket plus +Inf; cumulated only when rendered
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += seconds
+            self.count += 1
+
+    def time(self):
+        # `with histogram.time():` costs one attribute check when instrumentation is off
+        if not self._registry.enabled:
+            return NULL_TIMER
+        return _Timer(self)
+
+    def samples(self, name):
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            yield f'{name}_bucket{_format_labels(self.labels, [("le", _format_value(bound))])} {cumulative}'
+        yield f'{name}_sum{_format_labels(self.labels)} {_format_value(total)}'
+        yield f'{name}_count{_format_labels(self.labels)} {count}'
+
+class Counter:
+    def __init__(self, registry, labels):
+        self._registry = registry
+        self.labels = labels
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        if not self._registry.enabled:
+            return
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name):
+        yield f'{name}{_format_labels(self.labels)} {self.value}'
+
+class Gauge:
+    # Read from `fn` at scrape time, so there is nothing to update on the hot path
+    def __init__(self, registry, labels, fn):
+        self._registry = registry
+        self.labels = labels
+        self.fn = fn
+
+    def samples(self, name):
+        yield f'{name}{_format_labels(self.labels)} {_format_value(self.fn())}'
+
+class MetricsRegistry:
+    # Process-wide timing histograms, counters and scrape-time gauges rendered in the Prometheus
+    # text format. Metrics are declared once at import; hot paths only touch the returned objects
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._families = {}
+        self._lock = threading.Lock()
+
+    def _child(self, kind, name, help_text, labels, factory):
+        labels = tuple(sorted((labels or {}).items()))
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = {'kind': kind, 'help': help_text, 'children': {}}
+            elif family['kind'] != kind:
+                raise ValueError(f"Metric {name} is already registered as a {family['kind']}")
+            child = family['children'].get(labels)
+            if child is None:
+                child = family['children'][labels] = factory(labels)
+            return child
+
+    def histogram(self, name, help_text, labels=None, buckets=LATENCY_BUCKETS):
+        return self._child('histogram', name, help_text, labels, lambda labels: Histogram(self, labels, tuple(buckets)))
+
+    def counter(self, name, help_text, labels=None):
+        return self._child('counter', name, help_text, labels, lambda labels: Counter(self, labels))
+
+    def gauge(self, name, help_text, fn, labels=None):
+        return self._child('gauge', name, help_text, labels, lambda labels: Gauge(self, labels, fn))
+
+    def render(self):
+        with self._lock:
+            families = [(name, dict(family, children=list(family['children'].values())))
+                        for name, family in sorted(self._families.items())]
+
+        lines = []
+        for name, family in families:
+            lines.append(f"# HELP {name} {family['help']}")
+            lines.append(f"# TYPE {name} {family['kind']}")
+            for child in family['children']:
+                lines.extend(child.samples(name))
+        return '\n'.join(lines) + '\n'
+
+# MEDREC_METRICS=0 turns every timer and counter into a no-op; /api/metrics then only reports gauges
+metrics = MetricsRegistry(enabled=os.environ.get('MEDREC_METRICS', '1') != '0')
@@ -0,0 +1,131 @@
+import threading
+import time
+from collections import deque
+
+class QuantumKeyPool:
+    def __init__(self, generate_session, key_length=100, capacity=8, low_water=3, refill_interval=0.0, retry_interval=1.0,
+                 on_change=None, on_error=None):
+        self.generate_session = generate_session
+        # Called with no arguments whenever the pool depth changes (a refill or an acquire)
+        self.on_change = on_change
+        # Called with the exception when generate_session raises; the refill then backs off and retries
+        self.on_error = on_error
+        self.key_length = key_length
+        self.capacity = capacity
+        self.low_water = min(low_water, capacity)
+        self.refill_interval = refill_interval
+        self.retry_interval = retry_interval
+
+        self._sessions = deque()
+        self._condition = threading.Condition()
+        self._worker = None
+        self._running = False
+
+        self.generated = 0
+        self.rejected = 0
+        self.errors = 0
+        self.last_error = None
+        self.hits = 0
+        self.misses = 0
+        self._generation_time = 0.0
+        self._time_to_key_total = 0.0
+        self._time_to_key_last = None
+
+    def start(self):
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+            self._worker = threading.Thread(target=self._refill_loop, name='qkd-key-pool', daemon=True)
+            self._worker.start()
+
+    def stop(self, timeout=None):
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._worker is not None:
+            self._worker.join(timeout)
+
+    def _refill_loop(self):
+        while True:
+            with self._condition:
+                # Sleep until a consumer drains the pool down to the low-water mark
+                while self._running and len(self._sessions) > self.low_water:
+                    self._condition.wait()
+                if not self._running:
+                    return
+
+            while self._running and len(self._sessions) < self.capacity:
+                start = time.perf_counter()
+                try:
+                    session = self.generate_session(self.key_length)
+                except Exception as e:
+                    # A failing backend must not kill the refill thread; count it as a rejected round
+                    session = None
+                    self.errors += 1
+                    self.last_error = f'{type(e).__name__}: {e}'
+                    if self.on_error is not None:
+                        self.on_error(e)
+                elapsed = time.perf_counter() - start
+
+                with self._condition:
+                    self._generation_time += elapsed
+                    if session is None:
+                        self.rejected += 1
+                    else:
+                        self.generated += 1
+                        self._sessions.append(session)
+                if session is not None:
+                    self._changed()
+
+                # Back off while the channel keeps failing QBER verification (e.g. Eve is active)
+                delay = self.retry_interval if session is None else self.refill_interval
+                if delay:
+                    with self._condition:
+                        self._condition.wait_for(lambda: not self._running, timeout=delay)
+
+    def acquire(self, fallback=None):
+        start = time.perf_counter()
+
+        with self._condition:
+            session = self._sessions.popleft() if self._sessions else None
+            if len(self._sessions) <= self.low_water:
+                self._condition.notify()
+
+        if session is None:
+            self.misses += 1
+            if fallback is not None:
+                session = fallback()
+        else:
+            self.hits += 1
+
+        elapsed = time.perf_counter() - start
+        self._time_to_key_total += elapsed
+        self._time_to_key_last = elapsed
+        self._changed()
+
+        return session
+
+    def _changed(self):
+        if self.on_change is not None:
+            self.on_change()
+
+    def get_stats(self):
+        served = self.hits + self.misses
+
+        return {
+            'running': self._running,
+            'depth': len(self._sessions),
+            'capacity': self.capacity,
+            'low_water': self.low_water,
+            'key_length': self.key_length,
+            'keys_generated': self.generated,
+            'keys_rejected': self.rejected,
+            'errors': self.errors,
+            'last_error': self.last_error,
+            'hits': self.hits,
+            'misses': self.misses,
+            'refill_rate': round(self.generated / self._generation_time, 2) if self._generation_time else 0,
+            'avg_time_to_key_ms': round(self._time_to_key_total / served * 1000, 3) if served else None,
+            'last_time_to_key_ms': round(self._time_to_key_last * 1000, 3) if self._time_to_key_last is not None else None
+        }
@@ -0,0 +1,156 @@
+import threading
+import time
+from datetime import datetime
+from encryption import envelope_key_id
+
+class KeyRotationJob:
+    # Re-encrypts every vault record under the current key in bounded batches on a background
+    # thread. Each record is swapped in with a compare-and-put, so a concurrent write of the same
+    # record always wins and reads are only ever blocked for a single index update
+    def __init__(self, vault, crypto, batch_size=256, max_records_per_sec=None, on_progress=None):
+        self.vault = vault
+        self.crypto = crypto
+        self.batch_size = batch_size
+        self.max_records_per_sec = max_records_per_sec
+        self.on_progress = on_progress
+
+        self._condition = threading.Condition()
+        self._worker = None
+        self._generation = 0
+
+        self.state = 'idle'
+        self.key_id = None
+        self.total = 0
+        self.processed = 0
+        self.reencrypted = 0
+        self.skipped = 0
+        self.failed = 0
+        self.passes = 0
+        self.retired_keys = []
+        self.started_at = None
+        self._start_time = None
+        self._elapsed = 0.0
+
+    def start(self):
+        # A newer key supersedes a rotation that is still running; the old job stops at its next batch
+        with self._condition:
+            self._generation += 1
+            generation = self._generation
+            self._condition.notify_all()
+
+            self.state = 'running'
+            self.key_id = self.crypto.key_id
+            self.total = len(self.vault)
+            self.processed = 0
+            self.reencrypted = 0
+            self.skipped = 0
+            self.failed = 0
+            self.passes = 0
+            self.retired_keys = []
+            self.started_at = datetime.now().isoformat()
+            self._start_time = time.perf_counter()
+            self._elapsed = 0.0
+
+            self._worker = threading.Thread(target=self._run, args=(generation, self.key_id), name='key-rotation', daemon=True)
+            self._worker.start()
+
+    def cancel(self):
+        with self._condition:
+            self._generation += 1
+            if self.state == 'running':
+                self.state = 'cancelled'
+            self._condition.notify_all()
+
+    def _current(self, generation):
+        return generation == self._generation and self.crypto.key_id == self.key_id
+
+    def _run(self, generation, key_id):
+        try:
+            pending = self.vault.keys()
+            while pending:
+                self.passes += 1
+                for start in range(0, len(pending), self.batch_size):
+                    if not self._current(generation):
+                        return
+                    self._rotate_batch(pending[start:start + self.batch_size], key_id)
+                    self._throttle(generation)
+                    if self.on_progress is not None:
+                        self.on_progress(self.get_stats())
+
+                # Records written under an older sealer while the pass ran are picked up by a header-only rescan
+                pending = [
+                    patient_id for patient_id in self.vault.keys()
+                    if self._needs_rotation(patient_id, key_id)
+                ]
+                if self.failed:
+                    break
+
+            with self._condition:
+                if not self._current(generation):
+                    return
+                if not self.failed:
+                    # Nothing in the vault references the older keys any more
+                    self.retired_keys = self.crypto.retire_keys()
+                self._elapsed = time.perf_counter() - self._start_time
+                self.state = 'failed' if self.failed else 'completed'
+        except Exception:
+            with self._condition:
+                if generation == self._generation:
+                    self._elapsed = time.perf_counter() - self._start_time
+                    self.state = 'failed'
+            raise
+        finally:
+            if self.on_progress is not None and generation == self._generation:
+                self.on_progress(self.get_stats())
+
+    def _needs_rotation(self, patient_id, key_id):
+        envelope = self.vault.get(patient_id)
+        return envelope is not None and envelope_key_id(envelope) != key_id
+
+    def _rotate_batch(self, patient_ids, key_id):
+        seal = self.crypto.sealer()
+        for patient_id in patient_ids:
+            while True:
+                version, envelope = self.vault.get_versioned(patient_id)
+                if envelope is None or envelope_key_id(envelope) == key_id:
+                    self.skipped += 1
+                    break
+                try:
+                    payload = self.crypto.decrypt(envelope).encode()
+                except ValueError:
+                    # Tampered envelope or a key that was already retired; leave the record as is
+                    self.failed += 1
+                    break
+                if self.vault.put(patient_id, seal(payload), expected=version):
+                    self.reencrypted += 1
+                    break
+            self.processed += 1
+        self.vault.flush()
+
+    def _throttle(self, generation):
+        if not self.max_records_per_sec:
+            return
+        delay = self.processed / self.max_records_per_sec - (time.perf_counter() - self._start_time)
+        if delay > 0:
+            with self._condition:
+                self._condition.wait_for(lambda: generation != self._generation, timeout=delay)
+
+    def get_stats(self):
+        elapsed = time.perf_counter() - self._start_time if self.state == 'running' else self._elapsed
+
+        return {
+            'state': self.state,
+            'key_id': self.key_id,
+            'total': self.total,
+            'processed': self.processed,
+            'reencrypted': self.reencrypted,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'passes': self.passes,
+            'progress': round(min(self.processed / self.total, 1.0), 4) if self.total else 1.0,
+            'records_per_sec': round(self.processed / elapsed, 2) if elapsed else 0,
+            'max_records_per_sec': self.max_records_per_sec,
+            'retired_keys': self.retired_keys,
+            'started_at': self.started_at,
+            'elapsed': round(elapsed, 3)
+        }
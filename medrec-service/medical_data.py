@@ -1,96 +1,136 @@
-SAMPLE_RECORDS = [
-    {
-        "patient_id": "P001",
-        "name": "John Smith",
-        "age": 45,
-        "diagnosis": "Hypertension",
-        "treatment": "Lisinopril 10mg daily",
-        "doctor": "Dr. Sarah Johnson",
-        "date": "2024-11-08",
-        "notes": "Blood pressure well controlled. Continue current medication.",
-        "vitals": {
-            "blood_pressure": "128/82",
-            "heart_rate": 72,
-            "temperature": 98.6
-        }
-    },
-    {
-        "patient_id": "P002", 
-        "name": "Emily Davis",
-        "age": 32,
-        "diagnosis": "Type 2 Diabetes",
-        "treatment": "Metformin 500mg twice daily",
-        "doctor": "Dr. Michael Chen",
-        "date": "2024-11-07",
-        "notes": "HbA1c improved to 7.2%. Patient responding well to treatment.",
-        "vitals": {
-            "blood_pressure": "118/76",
-            "heart_rate": 68,
-            "glucose": 142
-        }
-    },
-    {
-        "patient_id": "P003",
-        "name": "Robert Wilson",
-        "age": 67,
-        "diagnosis": "Coronary Artery Disease",
-        "treatment": "Atorvastatin 40mg, Aspirin 81mg",
-        "doctor": "Dr. Lisa Rodriguez",
-        "date": "2024-11-06",
-        "notes": "Recent cardiac catheterization shows stable disease. Continue medications.",
-        "vitals": {
-            "blood_pressure": "132/86",
-            "heart_rate": 78,
-            "cholesterol": 185
-        }
-    },
-    {
-        "patient_id": "P004",
-        "name": "Maria Garcia",
-        "age": 28,
-        "diagnosis": "Asthma",
-        "treatment": "Albuterol inhaler PRN, Fluticasone daily",
-        "doctor": "Dr. James Williams",
-        "date": "2024-11-05",
-        "notes": "Asthma well controlled with current regimen. No recent exacerbations.",
-        "vitals": {
-            "blood_pressure": "115/72",
-            "heart_rate": 64,
-            "oxygen_saturation": 98
-        }
-    },
-    {
-        "patient_id": "P005",
-        "name": "David Lee",
-        "age": 55,
-        "diagnosis": "Chronic Kidney Disease Stage 3",
-        "treatment": "ACE inhibitor, Phosphate binders",
-        "doctor": "Dr. Patricia Brown",
-        "date": "2024-11-04",
-        "notes": "eGFR stable at 45. Continue nephroprotective therapy.",
-        "vitals": {
-            "blood_pressure": "135/88",
-            "heart_rate": 76,
-            "creatinine": 1.8
-        }
-    }
-]
+import json
+import os
+import sqlite3
+from array import array
+import numpy as np
+from instrumentation import metrics
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+RECORDS_PATH = os.environ.get('MEDREC_RECORDS_PATH', os.path.join(DATA_DIR, 'records.jsonl'))
+
+SEARCH_FIELDS = ('name', 'patient_id', 'diagnosis')
+GRAM_SIZE = 3
+# Joins the normalized fields so one substring test covers all of them without cross-field hits
+FIELD_SEPARATOR = '\x00'
+
+LOOKUP_SECONDS = metrics.histogram('medrec_record_lookup_seconds', 'Record lookup', {'source': 'store'})
+SEARCH_SECONDS = metrics.histogram('medrec_record_lookup_seconds', 'Record lookup', {'source': 'search'})
+
+class RecordStore:
+    def __init__(self, records=()):
+        self._records = []
+        self._by_id = {}
+        # Lower-cased, joined search fields are computed once at load, not on every query
+        self._normalized = []
+        # Trigram -> ascending record positions, stored as compact uint32 arrays
+        self._postings = {}
+        for record in records:
+            self.add(record)
+
+    @classmethod
+    def from_jsonl(cls, path):
+        with open(path) as f:
+            return cls(json.loads(line) for line in f if line.strip())
+
+    @classmethod
+    def from_sqlite(cls, path, table='records'):
+        # Expects a table with a JSON-encoded `data` column, one row per patient
+        connection = sqlite3.connect(path)
+        try:
+            rows = connection.execute(f'SELECT data FROM {table} ORDER BY rowid')
+            return cls(json.loads(data) for (data,) in rows)
+        finally:
+            connection.close()
+
+    @classmethod
+    def load(cls, path):
+        if path.endswith(('.db', '.sqlite', '.sqlite3')):
+            return cls.from_sqlite(path)
+        return cls.from_jsonl(path)
+
+    def add(self, record):
+        patient_id = record['patient_id']
+        if patient_id in self._by_id:
+            raise ValueError(f"Duplicate patient_id: {patient_id}")
+
+        position = len(self._records)
+        fields = tuple(str(record.get(field, '')).lower() for field in SEARCH_FIELDS)
+
+        self._records.append(record)
+        self._by_id[patient_id] = record
+        self._normalized.append(FIELD_SEPARATOR.join(fields))
+
+        grams = {field[i:i + GRAM_SIZE] for field in fields for i in range(len(field) - GRAM_SIZE + 1)}
+        for gram in grams:
+            posting = self._postings.get(gram)
+            if posting is None:
+                posting = self._postings[gram] = array('I')
+            posting.append(position)
+
+    def __len__(self):
+        return len(self._records)
+
+    def get(self, patient_id):
+        with LOOKUP_SECONDS.time():
+            return self._by_id.get(patient_id)
+
+    def list(self, offset=0, limit=None):
+        end = None if limit is None else offset + limit
+        return self._records[offset:end]
+
+    def _candidates(self, query):
+        if len(query) < GRAM_SIZE:
+            # Too short for the trigram index; scan the precomputed fields instead
+            return range(len(self._records))
+
+        postings = []
+        for gram in {query[i:i + GRAM_SIZE] for i in range(len(query) - GRAM_SIZE + 1)}:
+            posting = self._postings.get(gram)
+            if posting is None:
+                return []
+            postings.append(posting)
+
+        postings.sort(key=len)
+        candidates = np.frombuffer(postings[0], dtype=np.uint32)
+        for posting in postings[1:]:
+            candidates = np.intersect1d(candidates, np.frombuffer(posting, dtype=np.uint32), assume_unique=True)
+            if len(candidates) == 0:
+                break
+        return candidates.tolist()
+
+    def search(self, query, offset=0, limit=None):
+        # Returns (total matches, requested page)
+        with SEARCH_SECONDS.time():
+            return self._search(query, offset, limit)
+
+    def _search(self, query, offset, limit):
+        query = query.lower().replace(FIELD_SEPARATOR, '')
+        if not query:
+            return len(self._records), self.list(offset, limit)
+
+        candidates = self._candidates(query)
+        if len(query) == GRAM_SIZE:
+            # Grams are taken per field, so a single-gram hit is already an exact match
+            matches = candidates
+        else:
+            normalized = self._normalized
+            matches = [position for position in candidates if query in normalized[position]]
+        end = None if limit is None else offset + limit
+        return len(matches), [self._records[position] for position in matches[offset:end]]
+
+store = RecordStore.load(RECORDS_PATH)
 
 def get_patient_record(patient_id):
-    for record in SAMPLE_RECORDS:
-        if record["patient_id"] == patient_id:
-            return record
-    return None
+    return store.get(patient_id)
 
 def get_all_records():
-    return SAMPLE_RECORDS
+    return store.list()
+
+def list_records(offset=0, limit=None):
+    return len(store), store.list(offset, limit)
 
 def search_records(query):
-    query = query.lower()
-    results = []
-    for record in SAMPLE_RECORDS:
-        if (query in record["name"].lower() or 
-            query in record["patient_id"].lower() or
-            query in record["diagnosis"].lower()):
-            results.append(record)
-    return results
\ No newline at end of file
+    return store.search(query)[1]
+
+def search_records_page(query, offset=0, limit=None):
+    return store.search(query, offset, limit)
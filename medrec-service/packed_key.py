@@ -0,0 +1,73 @@
+import numpy as np
+
+# Set-bit count of every byte value, used to count differing bits between packed keys
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+class PackedKey:
+    # Bits are packed MSB-first (np.packbits order); pad bits in the last byte are always zero
+    __slots__ = ('data', 'length')
+
+    def __init__(self, data=None, length=0):
+        self.data = np.zeros(0, dtype=np.uint8) if data is None else np.asarray(data, dtype=np.uint8)
+        self.length = length
+
+    @classmethod
+    def from_bits(cls, bits):
+        bits = np.asarray(bits, dtype=np.uint8)
+        return cls(np.packbits(bits), len(bits))
+
+    def _clear_padding(self):
+        tail = self.length % 8
+        if tail and len(self.data):
+            self.data[-1] &= (0xFF << (8 - tail)) & 0xFF
+
+    def __len__(self):
+        return self.length
+
+    def __bool__(self):
+        return self.length > 0
+
+    def __eq__(self, other):
+        if not isinstance(other, PackedKey):
+            return NotImplemented
+        return self.length == other.length and np.array_equal(self.data, other.data)
+
+    def __repr__(self):
+        return f"PackedKey(length={self.length})"
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.length)
+            if step != 1:
+                return PackedKey.from_bits(self.to_bits()[index])
+
+            stop = max(start, stop)
+            if start % 8 == 0:
+                # Byte-aligned slices (e.g. the test/key split) only copy whole bytes
+                key = PackedKey(self.data[start // 8:(stop + 7) // 8].copy(), stop - start)
+                key._clear_padding()
+                return key
+
+            window = np.unpackbits(self.data[start // 8:(stop + 7) // 8])
+            offset = start % 8
+            return PackedKey.from_bits(window[offset:offset + stop - start])
+
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("PackedKey index out of range")
+        return int(self.data[index // 8] >> (7 - index % 8)) & 1
+
+    def to_bits(self):
+        return np.unpackbits(self.data, count=self.length)
+
+    def tolist(self):
+        return self.to_bits().tolist()
+
+    def to_bytes(self):
+        return self.data.tobytes()
+
+    def count_errors(self, other):
+        if self.length != other.length:
+            raise ValueError("Keys must have the same length to compare")
+        return int(_POPCOUNT[self.data ^ other.data].sum())
@@ -0,0 +1,184 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+JOB_STATES = ('queued', 'running', 'completed', 'failed', 'cancelled')
+FINISHED_STATES = ('completed', 'failed', 'cancelled')
+
+class JobCancelled(Exception):
+    pass
+
+class QKDJob:
+    def __init__(self, params, private=None):
+        self.id = uuid.uuid4().hex
+        self.params = params
+        # Inputs the run needs but that never appear in to_dict()
+        self.private = private or {}
+        self.state = 'queued'
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel = threading.Event()
+        self._last_report = 0.0
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def check_cancelled(self):
+        # Called by the running protocol between chunks; unwinds the job at the next chunk boundary
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    @property
+    def finished(self):
+        return self.state in FINISHED_STATES
+
+    def to_dict(self, result=False):
+        job = {
+            'id': self.id,
+            'state': self.state,
+            'params': self.params,
+            'progress': dict(self.progress),
+            'error': self.error,
+            'cancel_requested': self.cancel_requested,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+        if result:
+            job['result'] = self.result
+        return job
+
+class QKDJobManager:
+    # Key generation jobs on a bounded thread pool. At most max_concurrent jobs run at once and
+    # at most max_pending more wait in line; further submissions are refused rather than queued
+    # without bound. `run(job)` does the work and returns the result, reporting progress through
+    # report(); `on_update(job, kind)` sees every state change and throttled progress
+    def __init__(self, run, max_concurrent=2, max_pending=8, retention=256, progress_interval=0.1, on_update=None):
+        self.run = run
+        self.max_concurrent = max_concurrent
+        self.max_pending = max_pending
+        self.retention = retention
+        self.progress_interval = progress_interval
+        self.on_update = on_update
+
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix='qkd-job')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.submitted = 0
+        self.refused = 0
+        self.counts = dict.fromkeys(FINISHED_STATES, 0)
+
+    def _active(self):
+        return sum(1 for job in self._jobs.values() if not job.finished)
+
+    def submit(self, params, private=None):
+        # Returns the queued job, or None when the concurrency and queue limits are both used up
+        with self._lock:
+            if self._active() >= self.max_concurrent + self.max_pending:
+                self.refused += 1
+                return None
+            job = QKDJob(params, private)
+            self._jobs[job.id] = job
+            self.submitted += 1
+            self._evict()
+
+        self._notify(job, 'status')
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id):
+        # Queued jobs are cancelled at once; running ones stop at their next chunk
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                return job
+            job.cancel()
+            if job.state == 'queued':
+                self._finish(job, 'cancelled')
+        self._notify(job, 'status')
+        return job
+
+    def report(self, job, force=False, **progress):
+        # Progress events are throttled per job; `force` is for stage changes that must not be dropped
+        job.progress.update(progress)
+        now = time.monotonic()
+        if force or now - job._last_report >= self.progress_interval:
+            job._last_report = now
+            self._notify(job, 'progress')
+
+    def _finish(self, job, state):
+        job.state = state
+        job.finished_at = time.time()
+        self.counts[state] += 1
+
+    def _run(self, job):
+        with self._lock:
+            if job.finished:
+                return
+            job.state = 'running'
+            job.started_at = time.time()
+        self._notify(job, 'status')
+
+        try:
+            job.check_cancelled()
+            result = self.run(job)
+            state = 'completed'
+        except JobCancelled:
+            result, state = None, 'cancelled'
+        except Exception as e:
+            result, state = None, 'failed'
+            job.error = str(e)
+
+        with self._lock:
+            job.result = result
+            self._finish(job, state)
+        self._notify(job, 'status')
+
+    def _evict(self):
+        # Finished jobs are kept for polling until `retention` newer jobs have been submitted
+        excess = len(self._jobs) - self.retention
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished][:max(excess, 0)]:
+            del self._jobs[job_id]
+
+    def _notify(self, job, kind):
+        if self.on_update is not None:
+            self.on_update(job, kind)
+
+    def shutdown(self, cancel=True):
+        if cancel:
+            for job in self.list():
+                job.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=cancel)
+
+    def get_stats(self):
+        with self._lock:
+            states = dict.fromkeys(JOB_STATES, 0)
+            for job in self._jobs.values():
+                states[job.state] += 1
+        return {
+            'max_concurrent': self.max_concurrent,
+            'max_pending': self.max_pending,
+            'submitted': self.submitted,
+            'refused': self.refused,
+            'finished': dict(self.counts),
+            'jobs': states
+        }
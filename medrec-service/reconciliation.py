@@ -0,0 +1,112 @@
+import numpy as np
+from packed_key import PackedKey
+
+def binary_entropy(p):
+    if p <= 0 or p >= 1:
+        return 0.0
+    return float(-p * np.log2(p) - (1 - p) * np.log2(1 - p))
+
+def _prefix_parity(bits):
+    return np.concatenate(([0], np.bitwise_xor.accumulate(bits))).astype(np.uint8)
+
+def _block_parities(bits, starts):
+    return (np.add.reduceat(bits, starts) & 1).astype(np.uint8)
+
+def _bisect(alice_bits, bob_bits, lo, hi):
+    # Binary search every mismatched block at once; each halving step discloses one parity per block
+    alice_prefix = _prefix_parity(alice_bits)
+    bob_prefix = _prefix_parity(bob_bits)
+    lo = lo.copy()
+    hi = hi.copy()
+    leaked = 0
+
+    active = hi - lo > 1
+    while active.any():
+        idx = np.flatnonzero(active)
+        mid = (lo[idx] + hi[idx]) // 2
+        alice_parity = alice_prefix[mid] ^ alice_prefix[lo[idx]]
+        bob_parity = bob_prefix[mid] ^ bob_prefix[lo[idx]]
+        leaked += len(idx)
+
+        in_left = alice_parity != bob_parity
+        hi[idx[in_left]] = mid[in_left]
+        lo[idx[~in_left]] = mid[~in_left]
+        active = hi - lo > 1
+
+    return lo, leaked
+
+class CascadePass:
+    __slots__ = ('permutation', 'starts', 'ends', 'alice_bits', 'alice_parities')
+
+    def __init__(self, alice, permutation, block_size):
+        n = len(alice)
+        self.permutation = permutation
+        self.starts = np.arange(0, n, block_size)
+        self.ends = np.minimum(self.starts + block_size, n)
+        self.alice_bits = alice[permutation]
+        self.alice_parities = _block_parities(self.alice_bits, self.starts)
+
+    def correct(self, bob):
+        # Returns (positions flipped in bob, parity bits leaked by the binary searches)
+        bob_bits = bob[self.permutation]
+        mismatched = np.flatnonzero(_block_parities(bob_bits, self.starts) != self.alice_parities)
+        if len(mismatched) == 0:
+            return mismatched, 0
+
+        positions, leaked = _bisect(self.alice_bits, bob_bits, self.starts[mismatched], self.ends[mismatched])
+        flipped = self.permutation[positions]
+        bob[flipped] ^= 1
+        return flipped, leaked
+
+def cascade(alice_key, bob_key, qber, passes=4, rng=None):
+    # Both parties live in this process, so Alice's side of the parity exchange is read directly
+    rng = rng if rng is not None else np.random.default_rng()
+    alice = alice_key.to_bits()
+    bob = bob_key.to_bits().copy()
+    n = len(alice)
+
+    stats = {
+        'method': 'cascade',
+        'passes': passes,
+        'input_length': n,
+        'corrected_errors': 0,
+        'leaked_bits': 0,
+        'efficiency': None,
+        'residual_errors': 0
+    }
+    if n == 0:
+        return PackedKey(), stats
+
+    # Standard Cascade schedule: first block holds ~0.73/QBER bits, doubling every pass
+    block_size = int(min(n, max(4, 0.73 / qber))) if qber > 0 else n
+
+    cascade_passes = []
+    corrected = 0
+    leaked = 0
+    for i in range(passes):
+        permutation = np.arange(n) if i == 0 else rng.permutation(n)
+        cascade_pass = CascadePass(alice, permutation, block_size)
+        cascade_passes.append(cascade_pass)
+        leaked += len(cascade_pass.starts)
+
+        # A correction can flip the parity of blocks in earlier passes, so revisit them until stable
+        pending = [cascade_pass]
+        while pending:
+            flipped_any = False
+            for p in pending:
+                flipped, bits = p.correct(bob)
+                corrected += len(flipped)
+                leaked += bits
+                flipped_any = flipped_any or len(flipped) > 0
+            pending = cascade_passes if flipped_any else []
+
+        block_size = min(n, block_size * 2)
+
+    corrected_key = PackedKey.from_bits(bob)
+    stats['corrected_errors'] = corrected
+    stats['leaked_bits'] = leaked
+    stats['residual_errors'] = corrected_key.count_errors(alice_key)
+    if qber > 0:
+        stats['efficiency'] = leaked / (n * binary_entropy(qber))
+
+    return corrected_key, stats
@@ -0,0 +1,242 @@
+import fcntl
+import mmap
+import os
+import struct
+import threading
+from instrumentation import metrics
+
+# Entry layout: magic, patient id length, payload length, patient id, payload
+ENTRY_HEADER = struct.Struct('<4sHI')
+ENTRY_MAGIC = b'MRV1'
+SEGMENT_PREFIX = 'segment-'
+SEGMENT_SUFFIX = '.log'
+
+LOOKUP_SECONDS = metrics.histogram('medrec_record_lookup_seconds', 'Record lookup', {'source': 'vault'})
+
+class RecordVault:
+    # Append-only store of encrypted envelopes. Each put appends to the active segment and
+    # repoints the in-memory offset index; reads are zero-copy slices of mmap'd segments.
+    # With shared=True several processes can use one directory: appends are serialized with
+    # flock and each process catches up on the others' entries before reads and writes
+    def __init__(self, directory, max_segment_bytes=64 * 1024 * 1024, shared=False):
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        self.shared = shared
+        self._lock = threading.RLock()
+        self._index = {}
+        self._maps = {}
+        self._segment_sizes = {}
+        self._writer = None
+        self._active = None
+        self._dirty = False
+        self._live_bytes = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._flock = _FileLock(os.path.join(directory, '.lock') if shared else None)
+        with self._directory_lock():
+            for segment in self._segment_numbers():
+                self._load_segment(segment)
+
+            self._open_writer(max(self._segment_sizes, default=0) or 1)
+
+    def _directory_lock(self):
+        # Serializes appends (and startup tail repair) between processes sharing the directory
+        return self._flock
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, f'{SEGMENT_PREFIX}{segment:06d}{SEGMENT_SUFFIX}')
+
+    def _segment_numbers(self):
+        return sorted(
+            int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+            for name in os.listdir(self.directory)
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)
+        )
+
+    def _load_segment(self, segment, offset=0, repair=True):
+        path = self._segment_path(segment)
+        size = os.path.getsize(path)
+
+        if size:
+            with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                while offset + ENTRY_HEADER.size <= size:
+                    magic, id_length, payload_length = ENTRY_HEADER.unpack_from(data, offset)
+                    end = offset + ENTRY_HEADER.size + id_length + payload_length
+                    if magic != ENTRY_MAGIC or end > size:
+                        break
+                    id_start = offset + ENTRY_HEADER.size
+                    patient_id = data[id_start:id_start + id_length].decode()
+                    self._index_entry(patient_id, (segment, id_start + id_length, payload_length))
+                    offset = end
+
+        if offset < size and repair:
+            # Drop a torn write left by a crash mid-append
+            with open(path, 'r+b') as f:
+                f.truncate(offset)
+
+        self._segment_sizes[segment] = offset
+
+    def _index_entry(self, patient_id, entry):
+        previous = self._index.get(patient_id)
+        if previous is not None:
+            self._live_bytes -= ENTRY_HEADER.size + len(patient_id.encode()) + previous[2]
+        self._live_bytes += ENTRY_HEADER.size + len(patient_id.encode()) + entry[2]
+        self._index[patient_id] = entry
+
+    def _open_writer(self, segment):
+        if self._writer is not None:
+            self._writer.close()
+        self._active = segment
+        self._writer = open(self._segment_path(segment), 'ab')
+        self._segment_sizes.setdefault(segment, 0)
+
+    def _catch_up(self):
+        # Indexes entries other processes appended since this one last looked
+        for segment in self._segment_numbers():
+            known = self._segment_sizes.get(segment)
+            if known is None or os.path.getsize(self._segment_path(segment)) > known:
+                self._load_segment(segment, known or 0, repair=False)
+        newest = max(self._segment_sizes)
+        if newest != self._active:
+            self._open_writer(newest)
+
+    def _map(self, segment, end):
+        mapped = self._maps.get(segment)
+        if mapped is None or len(mapped) < end:
+            if segment == self._active and self._dirty:
+                self._writer.flush()
+                self._dirty = False
+            with open(self._segment_path(segment), 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            # Replaced maps are closed by GC once no reader holds a slice of them
+            self._maps[segment] = mapped
+        return mapped
+
+    def put(self, patient_id, envelope, expected=None):
+        # With `expected` (a version from get_versioned) this is a compare-and-put: it appends
+        # nothing and returns False if the record was rewritten since that version was read
+        key = patient_id.encode()
+        with self._lock, self._directory_lock():
+            if self.shared:
+                self._catch_up()
+            if expected is not None and self._index.get(patient_id) != expected:
+                return False
+            if self._segment_sizes[self._active] >= self.max_segment_bytes:
+                self._open_writer(self._active + 1)
+
+            segment = self._active
+            offset = self._segment_sizes[segment]
+            self._writer.write(ENTRY_HEADER.pack(ENTRY_MAGIC, len(key), len(envelope)))
+            self._writer.write(key)
+            self._writer.write(envelope)
+            self._dirty = True
+
+            payload_offset = offset + ENTRY_HEADER.size + len(key)
+            self._segment_sizes[segment] = payload_offset + len(envelope)
+            self._index_entry(patient_id, (segment, payload_offset, len(envelope)))
+            if self.shared:
+                # Other processes read the file, not this process's write buffer
+                self._writer.flush()
+                self._dirty = False
+            return True
+
+    def get(self, patient_id):
+        return self.get_versioned(patient_id)[1]
+
+    def get_versioned(self, patient_id):
+        # Returns (version, envelope view); the version is the entry's location, which every put moves
+        with LOOKUP_SECONDS.time(), self._lock:
+            if self.shared:
+                self._catch_up()
+            entry = self._index.get(patient_id)
+            if entry is None:
+                return None, None
+            segment, offset, length = entry
+            return entry, memoryview(self._map(segment, offset + length))[offset:offset + length]
+
+    def flush(self):
+        with self._lock:
+            if self._dirty:
+                self._writer.flush()
+                os.fsync(self._writer.fileno())
+                self._dirty = False
+
+    def refresh(self):
+        if self.shared:
+            with self._lock:
+                self._catch_up()
+
+    def __contains__(self, patient_id):
+        self.refresh()
+        return patient_id in self._index
+
+    def __len__(self):
+        self.refresh()
+        return len(self._index)
+
+    def keys(self):
+        with self._lock:
+            self.refresh()
+            return list(self._index)
+
+    def get_stats(self):
+        with self._lock:
+            total_bytes = sum(self._segment_sizes.values())
+            live_bytes = self._live_bytes
+            return {
+                'records': len(self._index),
+                'segments': len(self._segment_sizes),
+                'total_bytes': total_bytes,
+                'live_bytes': live_bytes,
+                'garbage_ratio': round(1 - live_bytes / total_bytes, 4) if total_bytes else 0.0
+            }
+
+    def compact(self):
+        # Rewrites only the live envelopes into fresh segments, then drops the old files.
+        # Superseded envelopes (e.g. from before a key rotation) are reclaimed here
+        if self.shared:
+            raise ValueError("Compaction needs exclusive access; run it on a vault opened with shared=False")
+        with self._lock:
+            old_segments = sorted(self._segment_sizes)
+            entries = list(self._index.items())
+            self.flush()
+            old_maps = {segment: self._map(segment, size) for segment, size in self._segment_sizes.items() if size}
+
+            self._writer.close()
+            self._writer = None
+            self._maps = {}
+            self._segment_sizes = {}
+            self._index = {}
+            self._live_bytes = 0
+            self._open_writer(old_segments[-1] + 1)
+
+            # Envelopes are copied straight from the old maps, never buffered in memory as a whole
+            for patient_id, (segment, offset, length) in entries:
+                self.put(patient_id, old_maps[segment][offset:offset + length])
+            self.flush()
+
+            for segment in old_segments:
+                os.remove(self._segment_path(segment))
+
+            return self.get_stats()
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self._writer.close()
+            self._maps = {}
+
+class _FileLock:
+    # flock-based cross-process lock; a no-op without a path. Callers already hold the vault's
+    # thread lock, so one open file per process is enough
+    def __init__(self, path):
+        self._file = open(path, 'a') if path is not None else None
+
+    def __enter__(self):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
@@ -0,0 +1,155 @@
+import json
+import os
+import sqlite3
+import threading
+from collections import deque
+
+class LocalStateBackend:
+    # Process-local state behind one lock; the default for a single worker
+    shared = False
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._values = {}
+        self._logs = {}
+        self._version = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._values.get(key, default)
+
+    def get_many(self, defaults):
+        with self._lock:
+            return {key: self._values.get(key, default) for key, default in defaults.items()}
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def set_many(self, values):
+        with self._lock:
+            self._values.update(values)
+            self._version += 1
+
+    def update(self, key, fn, default=None):
+        # Atomic read-modify-write; returns the new value
+        with self._lock:
+            value = fn(self._values.get(key, default))
+            self._values[key] = value
+            self._version += 1
+            return value
+
+    def append(self, name, item, maxlen=100):
+        with self._lock:
+            log = self._logs.get(name)
+            if log is None or log.maxlen != maxlen:
+                log = self._logs[name] = deque(log or (), maxlen=maxlen)
+            log.append(item)
+            self._version += 1
+
+    def tail(self, name, n=None):
+        with self._lock:
+            log = list(self._logs.get(name, ()))
+        return log if n is None else log[-n:]
+
+    def version(self):
+        # Bumped by every write, so readers can cheaply tell whether anything changed
+        return self._version
+
+class SQLiteStateBackend:
+    # State shared by every worker process on the host through one SQLite file (WAL mode).
+    # Values are JSON; each write is a single IMMEDIATE transaction, so read-modify-write
+    # updates are serialized across processes
+    shared = True
+
+    def __init__(self, path, timeout=5.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+        # The file holds the (wrapped) key ring and the security log: created owner-only, and
+        # refused outright if anyone else can read it. SQLite gives its -wal and -shm files the same mode
+        os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o600))
+        if os.stat(path).st_mode & 0o004:
+            raise PermissionError(f"State file {path} is world-readable; restrict it with chmod 600")
+
+        db = self._db()
+        db.execute('PRAGMA journal_mode=WAL')
+        with db:
+            db.execute('CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            db.execute('CREATE TABLE IF NOT EXISTS logs (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, item TEXT NOT NULL)')
+            db.execute('CREATE INDEX IF NOT EXISTS logs_name ON logs (name, id)')
+            db.execute('CREATE TABLE IF NOT EXISTS version (id INTEGER PRIMARY KEY CHECK (id = 0), value INTEGER NOT NULL)')
+            db.execute('INSERT OR IGNORE INTO version VALUES (0, 0)')
+
+    def _db(self):
+        # sqlite3 connections are not shared between threads, so each thread (and process) opens its own
+        db = getattr(self._local, 'db', None)
+        if db is None or getattr(self._local, 'pid', None) != os.getpid():
+            db = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def _write(self, fn):
+        db = self._db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            result = fn(db)
+            db.execute('UPDATE version SET value = value + 1 WHERE id = 0')
+            db.execute('COMMIT')
+            return result
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+
+    def get(self, key, default=None):
+        row = self._db().execute('SELECT value FROM state WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def get_many(self, defaults):
+        keys = list(defaults)
+        rows = self._db().execute(
+            f'SELECT key, value FROM state WHERE key IN ({", ".join("?" * len(keys))})', keys
+        ).fetchall()
+        found = {key: json.loads(value) for key, value in rows}
+        return {key: found.get(key, default) for key, default in defaults.items()}
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def set_many(self, values):
+        rows = [(key, json.dumps(value)) for key, value in values.items()]
+        self._write(lambda db: db.executemany('INSERT OR REPLACE INTO state VALUES (?, ?)', rows))
+
+    def update(self, key, fn, default=None):
+        def apply(db):
+            row = db.execute('SELECT value FROM state WHERE key = ?', (key,)).fetchone()
+            value = fn(json.loads(row[0]) if row else default)
+            db.execute('INSERT OR REPLACE INTO state VALUES (?, ?)', (key, json.dumps(value)))
+            return value
+        return self._write(apply)
+
+    def append(self, name, item, maxlen=100):
+        def apply(db):
+            cursor = db.execute('INSERT INTO logs (name, item) VALUES (?, ?)', (name, json.dumps(item)))
+            db.execute('DELETE FROM logs WHERE name = ? AND id <= ?', (name, cursor.lastrowid - maxlen))
+        self._write(apply)
+
+    def tail(self, name, n=None):
+        rows = self._db().execute(
+            'SELECT item FROM logs WHERE name = ? ORDER BY id DESC LIMIT ?', (name, -1 if n is None else n)
+        ).fetchall()
+        return [json.loads(item) for (item,) in reversed(rows)]
+
+    def version(self):
+        return self._db().execute('SELECT value FROM version WHERE id = 0').fetchone()[0]
+
+def create_state_backend(url=None):
+    # 'memory' (default) or 'sqlite:///path/to/state.db'
+    url = url or 'memory'
+    if url == 'memory':
+        return LocalStateBackend()
+    if url.startswith('sqlite:///'):
+        return SQLiteStateBackend(url[len('sqlite:///'):])
+    raise ValueError(f"Unknown state backend: {url}")
@@ -0,0 +1,119 @@
+import json
+import threading
+import uuid
+
+class VersionedState:
+    # Named sections, each stamped with the sequence number of its last change. A delta since
+    # any seq is just the sections stamped after it, so no change log has to be kept.
+    # With a shared state backend the sections, seq and epoch live there, so every worker hands
+    # out the same ETags and can answer a `since` from any other worker
+    def __init__(self, backend=None, key='status_sections'):
+        self.backend = backend if backend is not None and backend.shared else None
+        self.key = key
+        # Distinguishes this process's sequence numbers from a previous run's
+        self._epoch = uuid.uuid4().hex[:8]
+        self._seq = 0
+        self._sections = {}
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._pushed_seq = 0
+
+    def _shared(self):
+        shared = self.backend.get(self.key)
+        if shared is None:
+            return self._epoch, 0, {}
+        return shared['epoch'], shared['seq'], shared['sections']
+
+    @property
+    def epoch(self):
+        return self._shared()[0] if self.backend else self._epoch
+
+    @property
+    def seq(self):
+        return self._shared()[1] if self.backend else self._seq
+
+    def _read(self):
+        # (epoch, seq, {name: (seq, value)}); callers hold the lock
+        if self.backend:
+            return self._shared()
+        return self._epoch, self._seq, self._sections
+
+    def update(self, name, value):
+        # Returns True if the value changed and the sequence number moved
+        if self.backend:
+            # Compared as stored, so tuples and int keys don't count as changes on every refresh
+            value = json.loads(json.dumps(value))
+            current = self._shared()[2].get(name)
+            if current is not None and current[1] == value:
+                # Every backend write bumps its version and makes all workers resync, so skip no-ops
+                return False
+            changed = False
+
+            def apply(shared):
+                nonlocal changed
+                shared = shared or {'epoch': self._epoch, 'seq': 0, 'sections': {}}
+                current = shared['sections'].get(name)
+                if current is not None and current[1] == value:
+                    return shared
+                changed = True
+                shared['seq'] += 1
+                shared['sections'][name] = [shared['seq'], value]
+                return shared
+
+            self.backend.update(self.key, apply)
+            return changed
+
+        with self._lock:
+            current = self._sections.get(name)
+            if current is not None and current[1] == value:
+                return False
+            self._seq += 1
+            self._sections[name] = (self._seq, value)
+            return True
+
+    def etag(self, seq=None):
+        with self._lock:
+            epoch, current, _ = self._read()
+        return f'"{epoch}-{current if seq is None else seq}"'
+
+    def delta(self, since=0):
+        with self._lock:
+            epoch, current, sections = self._read()
+            # A seq from another epoch (or the future) can't be diffed against, so send everything
+            full = since <= 0 or since > current
+            return {
+                'epoch': epoch,
+                'seq': current,
+                'since': 0 if full else since,
+                'full': full,
+                'changes': {name: value for name, (seq, value) in sections.items() if full or seq > since}
+            }
+
+    def mark_pushed(self):
+        # Everything up to now is already known to subscribers (e.g. the initial state)
+        with self._lock:
+            self._pushed_seq = self._read()[1]
+
+    def next_delta(self):
+        # Changes since the previous push; evaluated when the event bus emits, so coalesced pushes merge
+        delta = self.delta(self._pushed_seq)
+        with self._lock:
+            self._pushed_seq = delta['seq']
+        return delta
+
+    def snapshot_json(self, build):
+        # Full snapshots are serialized once per seq and shared by every poller until the next change
+        with self._lock:
+            epoch, seq, sections = self._read()
+            if self._snapshot is not None and self._snapshot[:2] == (epoch, seq):
+                return self._snapshot[1:]
+            values = {name: value for name, (_, value) in sections.items()}
+
+        body = build(values)
+        body.update(seq=seq, epoch=epoch)
+        snapshot = (epoch, seq, json.dumps(body, separators=(',', ':')))
+        with self._lock:
+            # Only cached while still current; a newer seq means another thread moved on
+            if self._snapshot is None or self._snapshot[1] <= seq:
+                self._snapshot = snapshot
+        return snapshot[1:]
@@ -0,0 +1,52 @@
+import importlib
+import os
+import time
+import pytest
+
+KEY_LENGTH = 50000
+
+@pytest.fixture(scope='module')
+def service(tmp_path_factory):
+    # The app opens its vault and time series at import, so point them at a scratch directory first
+    directory = tmp_path_factory.mktemp('medrec')
+    os.environ['MEDREC_VAULT_DIR'] = str(directory / 'vault')
+    os.environ['MEDREC_TIMESERIES_PATH'] = str(directory / 'metrics.sqlite3')
+    service = importlib.import_module('app')
+    yield service
+    service.key_pool.stop()
+    service.event_bus.stop()
+    service.qkd_jobs.shutdown()
+
+@pytest.fixture
+def client(service):
+    client = service.app.test_client()
+    yield client
+    client.post('/api/attack/simulate', json={'active': False})
+
+def attack(client):
+    client.post('/api/attack/simulate', json={'active': True, 'strategy': 'random', 'fraction': 1.0})
+
+def test_clean_round_is_not_aborted(client):
+    body = client.post('/api/qkd/generate', json={'key_length': KEY_LENGTH}).get_json()
+    assert body['status'] == 'success'
+    assert body['qubits_processed'] == KEY_LENGTH
+    assert body['metrics']['change_point'] is None
+
+def test_attacked_round_aborts_early(client):
+    attack(client)
+    body = client.post('/api/qkd/generate', json={'key_length': KEY_LENGTH}).get_json()
+    assert body['status'] == 'rejected_early'
+    assert body['qubits_processed'] < KEY_LENGTH
+    assert body['metrics']['change_point']['method'] in ('cusum', 'sprt')
+    assert body['final_key_length'] == 0
+
+def test_attacked_job_aborts_early(client):
+    attack(client)
+    job_id = client.post('/api/qkd/jobs', json={'key_length': KEY_LENGTH}).get_json()['id']
+    deadline = time.monotonic() + 30
+    while (job := client.get(f'/api/qkd/jobs/{job_id}').get_json())['state'] not in ('completed', 'failed', 'cancelled'):
+        assert time.monotonic() < deadline, 'job did not finish'
+        time.sleep(0.05)
+    assert job['state'] == 'completed'
+    assert job['result']['status'] == 'rejected_early'
+    assert job['result']['qubits_processed'] < KEY_LENGTH
@@ -0,0 +1,52 @@
+import importlib.util
+import math
+import pytest
+from bb84 import BB84Protocol
+from eavesdropper import Eve
+
+KEY_LENGTH = 4000
+SEEDS = (1, 2, 3)
+# Allowed deviation from the expected rate, in binomial standard deviations
+SIGMAS = 5
+
+requires_qiskit = pytest.mark.skipif(importlib.util.find_spec('qiskit_aer') is None, reason='qiskit-aer is not installed')
+BACKENDS = ['numpy', pytest.param('qiskit', marks=requires_qiskit)]
+
+def run_round(backend, seed, eve):
+    bb84 = BB84Protocol(KEY_LENGTH, backend=backend, seed=seed)
+    qubits = bb84.alice.prepare_qubits()
+    if eve:
+        qubits = Eve(backend=backend, interception_fraction=1.0, rng=bb84.rng).intercept_and_resend(qubits)
+    bb84.execute(qubits)
+    return bb84
+
+def assert_rate(observed_percent, expected, trials):
+    tolerance = SIGMAS * math.sqrt(expected * (1 - expected) / trials)
+    assert abs(observed_percent / 100 - expected) <= tolerance, (observed_percent, expected, trials)
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('seed', SEEDS)
+def test_no_eve_is_error_free(backend, seed):
+    bb84 = run_round(backend, seed, eve=False)
+    assert bb84.calculate_qber() == 0
+    assert_rate(bb84.get_basis_efficiency(), 0.5, KEY_LENGTH)
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('seed', SEEDS)
+def test_full_intercept_resend_gives_quarter_qber(backend, seed):
+    bb84 = run_round(backend, seed, eve=True)
+    # Eve picks the wrong basis half the time, and Bob then reads a random bit
+    assert_rate(bb84.calculate_qber(), 0.25, bb84.sifted_length)
+    assert_rate(bb84.get_basis_efficiency(), 0.5, KEY_LENGTH)
+
+@requires_qiskit
+@pytest.mark.parametrize('eve', [False, True])
+def test_backends_agree(eve):
+    # Same seed, so the same bits and bases; only the measurement outcomes may differ
+    numpy_round = run_round('numpy', SEEDS[0], eve)
+    qiskit_round = run_round('qiskit', SEEDS[0], eve)
+    assert numpy_round.basis_matches == qiskit_round.basis_matches
+    qber_numpy, qber_qiskit = numpy_round.calculate_qber() / 100, qiskit_round.calculate_qber() / 100
+    expected = 0.25 if eve else 0.0
+    tolerance = SIGMAS * math.sqrt(2 * expected * (1 - expected) / numpy_round.sifted_length)
+    assert abs(qber_numpy - qber_qiskit) <= tolerance
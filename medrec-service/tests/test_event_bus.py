@@ -0,0 +1,37 @@
+import threading
+import time
+from event_bus import EventBus
+
+class RecordingSocketIO:
+    def __init__(self):
+        self.emits = []
+
+    def start_background_task(self, target):
+        threading.Thread(target=target, daemon=True).start()
+
+    def emit(self, event, data, to=None):
+        self.emits.append((time.perf_counter(), event, data))
+
+def test_continuous_publishing_still_emits_every_window():
+    socketio = RecordingSocketIO()
+    bus = EventBus(socketio, window=0.1)
+    bus.start()
+    try:
+        start = time.perf_counter()
+        sequence = 0
+        # 100 Hz for one second, far faster than the window
+        while time.perf_counter() - start < 1.0:
+            sequence += 1
+            bus.publish('security_status_update', {'sequence': sequence})
+            time.sleep(0.01)
+        stopped = time.perf_counter()
+    finally:
+        bus.stop()
+
+    during = [at for at, event, _ in socketio.emits if event == 'security_status_update' and at < stopped]
+    assert len(during) >= 5
+    gaps = [b - a for a, b in zip([start] + during, during + [stopped])]
+    assert max(gaps) < 0.3
+    # Each emit carries the latest state, not the one that opened the window
+    assert [data['sequence'] for _, _, data in socketio.emits] == sorted(data['sequence'] for _, _, data in socketio.emits)
+    assert bus.get_stats()['coalesced'] > 0
@@ -0,0 +1,30 @@
+import time
+from key_pool import QuantumKeyPool
+
+def test_refill_survives_generation_errors():
+    calls = []
+    errors = []
+
+    def generate(key_length):
+        calls.append(key_length)
+        if len(calls) <= 2:
+            raise RuntimeError('backend unavailable')
+        return object()
+
+    pool = QuantumKeyPool(generate, capacity=3, low_water=1, retry_interval=0.01, on_error=errors.append)
+    pool.start()
+    try:
+        deadline = time.monotonic() + 5
+        while pool.get_stats()['depth'] < 3:
+            assert time.monotonic() < deadline, 'pool never refilled'
+            time.sleep(0.01)
+    finally:
+        pool.stop()
+
+    stats = pool.get_stats()
+    assert stats['errors'] == 2
+    assert stats['keys_rejected'] == 2
+    assert stats['last_error'] == 'RuntimeError: backend unavailable'
+    assert [str(e) for e in errors] == ['backend unavailable'] * 2
+    assert pool.acquire() is not None
+    assert pool.get_stats()['hits'] == 1
@@ -0,0 +1,53 @@
+import json
+import time
+import pytest
+from batch_pipeline import BatchEncryptionPipeline
+from encryption import QuantumEncryption
+from key_rotation import KeyRotationJob
+from packed_key import PackedKey
+from record_vault import RecordVault
+
+RECORDS = {f'P{i:03d}': {'patient_id': f'P{i:03d}', 'notes': 'x' * 64} for i in range(200)}
+
+def new_key(seed):
+    return PackedKey.from_bits([(seed >> (i % 16)) & 1 for i in range(256)])
+
+def wait_for(job, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while job.get_stats()['state'] == 'running':
+        assert time.monotonic() < deadline, 'rotation did not finish'
+        time.sleep(0.01)
+
+@pytest.fixture
+def vault(tmp_path):
+    vault = RecordVault(str(tmp_path / 'vault'))
+    yield vault
+    vault.close()
+
+def test_batch_outliving_a_rotation_stays_readable(vault):
+    crypto = QuantumEncryption()
+    crypto.set_quantum_key(new_key(0x1234))
+    rotation = KeyRotationJob(vault, crypto)
+    pipeline = BatchEncryptionPipeline(RECORDS.get, crypto, workers=1, window=8, on_stale_key=rotation.start)
+
+    batch = pipeline.run(list(RECORDS))
+    for _ in range(len(RECORDS) // 2):
+        patient_id, _, envelope = next(batch)
+        vault.put(patient_id, envelope)
+
+    # A new key arrives and its rotation finishes while the batch is still sealing under the old one
+    old_key_id = crypto.key_id
+    crypto.set_quantum_key(new_key(0xBEEF))
+    rotation.start()
+    wait_for(rotation)
+    assert rotation.get_stats()['state'] == 'completed'
+    assert old_key_id in crypto.keys
+
+    for patient_id, _, envelope in batch:
+        vault.put(patient_id, envelope)
+    # The batch ended under a stale key, so a follow-up rotation moved its records and retired the key
+    wait_for(rotation)
+    assert old_key_id not in crypto.keys
+
+    for patient_id, record in RECORDS.items():
+        assert json.loads(crypto.decrypt(vault.get(patient_id))) == record
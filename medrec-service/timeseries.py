@@ -0,0 +1,180 @@
+import atexit
+import sqlite3
+import threading
+import time
+import numpy as np
+
+METRICS = ('qber', 'fidelity', 'sifted_length')
+# Rollup resolutions in seconds; anything finer or not a multiple of one is served from raw samples
+RESOLUTIONS = (60, 3600, 86400)
+
+class MetricsTimeSeries:
+    # QKD session metrics in SQLite: raw samples plus min/sum/max rollups at each resolution.
+    # Samples are buffered and written in one transaction per batch, with the rollups
+    # pre-aggregated in Python so each batch upserts one row per touched bucket
+    def __init__(self, path, resolutions=RESOLUTIONS, batch_size=512, flush_interval=1.0, max_points=10000):
+        self.path = path
+        self.max_points = max_points
+        self.resolutions = tuple(sorted(resolutions))
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending = []
+        self._last_flush = time.monotonic()
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS samples ('
+            'ts REAL NOT NULL, qber REAL, fidelity REAL, sifted_length INTEGER, eve_active INTEGER)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS samples_ts ON samples (ts)')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS rollups ('
+            'resolution INTEGER NOT NULL, bucket INTEGER NOT NULL, count INTEGER NOT NULL, eve_count INTEGER NOT NULL, '
+            + ', '.join(f'{m}_min REAL, {m}_sum REAL, {m}_max REAL' for m in METRICS)
+            + ', PRIMARY KEY (resolution, bucket)) WITHOUT ROWID'
+        )
+        self._db.commit()
+
+        # Samples never sit in the buffer much longer than flush_interval, even when no further
+        # record() or query arrives, and whatever is left is written at interpreter exit
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name='timeseries-flush', daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    def _flush_loop(self):
+        while not self._closed.wait(self.flush_interval):
+            with self._lock:
+                if not self._closed.is_set():
+                    self._flush()
+
+    def record(self, timestamp, qber, fidelity, sifted_length, eve_active):
+        with self._lock:
+            self._pending.append((timestamp, float(qber), float(fidelity), int(sifted_length), int(bool(eve_active))))
+            if len(self._pending) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+        samples, self._pending = self._pending, []
+
+        rollups = {}
+        for ts, qber, fidelity, sifted_length, eve in samples:
+            values = (qber, fidelity, sifted_length)
+            for resolution in self.resolutions:
+                key = (resolution, int(ts // resolution) * resolution)
+                row = rollups.get(key)
+                if row is None:
+                    rollups[key] = [1, eve] + [v for value in values for v in (value, value, value)]
+                    continue
+                row[0] += 1
+                row[1] += eve
+                for i, value in enumerate(values):
+                    base = 2 + 3 * i
+                    row[base] = min(row[base], value)
+                    row[base + 1] += value
+                    row[base + 2] = max(row[base + 2], value)
+
+        columns = ', '.join(f'{m}_min, {m}_sum, {m}_max' for m in METRICS)
+        updates = ', '.join(
+            f'{m}_min = MIN({m}_min, excluded.{m}_min), {m}_sum = {m}_sum + excluded.{m}_sum, '
+            f'{m}_max = MAX({m}_max, excluded.{m}_max)'
+            for m in METRICS
+        )
+        with self._db:
+            self._db.executemany('INSERT INTO samples VALUES (?, ?, ?, ?, ?)', samples)
+            self._db.executemany(
+                f'INSERT INTO rollups (resolution, bucket, count, eve_count, {columns}) '
+                f'VALUES (?, ?, ?, ?, {", ".join("?" * 3 * len(METRICS))}) '
+                f'ON CONFLICT (resolution, bucket) DO UPDATE SET count = count + excluded.count, '
+                f'eve_count = eve_count + excluded.eve_count, {updates}',
+                [key + tuple(row) for key, row in rollups.items()]
+            )
+
+    def _resolution_for(self, bucket):
+        usable = [r for r in self.resolutions if r <= bucket and bucket % r == 0]
+        return usable[-1] if usable else None
+
+    def query(self, start, end, bucket):
+        # Covers the non-empty buckets in [start, end): count, eve count and min/mean/max per metric
+        bucket = int(bucket)
+        if bucket <= 0:
+            raise ValueError("bucket must be a positive number of seconds")
+        if end <= start:
+            raise ValueError("'to' must be later than 'from'")
+        if (end - start) / bucket > self.max_points:
+            raise ValueError(f"Range spans more than {self.max_points} buckets; use a larger bucket")
+
+        resolution = self._resolution_for(bucket)
+        columns = ', '.join(f'{m}_min, {m}_sum, {m}_max' for m in METRICS)
+        aggregates = ', '.join(
+            f'MIN({m}_min), SUM({m}_sum), MAX({m}_max)' if resolution else f'MIN({m}), SUM({m}), MAX({m})'
+            for m in METRICS
+        )
+        if resolution == bucket:
+            # Rollup rows already are the requested buckets, so no regrouping is needed
+            sql = (
+                f'SELECT bucket, count, eve_count, {columns} FROM rollups '
+                'WHERE resolution = :resolution AND bucket >= :start AND bucket < :end ORDER BY bucket'
+            )
+        elif resolution:
+            sql = (
+                f'SELECT (bucket / :bucket) * :bucket AS b, SUM(count), SUM(eve_count), {aggregates} '
+                'FROM rollups WHERE resolution = :resolution AND bucket >= :start AND bucket < :end '
+                'GROUP BY b ORDER BY b'
+            )
+        else:
+            sql = (
+                f'SELECT CAST(ts / :bucket AS INTEGER) * :bucket AS b, COUNT(*), SUM(eve_active), {aggregates} '
+                'FROM samples WHERE ts >= :start AND ts < :end GROUP BY b ORDER BY b'
+            )
+        if resolution:
+            # A rollup bucket is included when it starts inside the range, so edges snap to its resolution
+            start = int(start // resolution) * resolution
+
+        with self._lock:
+            self._flush()
+            rows = self._db.execute(sql, {'bucket': bucket, 'resolution': resolution, 'start': start, 'end': end}).fetchall()
+
+        # Columnar response: one array per field keeps year-long hourly series small and cheap to build
+        data = np.array(rows, dtype=np.float64).reshape(len(rows), 3 + 3 * len(METRICS))
+        count = data[:, 1]
+        series = {
+            'bucket_start': data[:, 0].astype(np.int64).tolist(),
+            'count': count.astype(np.int64).tolist(),
+            'eve_active_count': data[:, 2].astype(np.int64).tolist()
+        }
+        for i, metric in enumerate(METRICS):
+            base = 3 + 3 * i
+            series[metric] = {
+                'min': data[:, base].tolist(),
+                'mean': (data[:, base + 1] / count).tolist(),
+                'max': data[:, base + 2].tolist()
+            }
+
+        return {
+            'from': start,
+            'to': end,
+            'bucket': bucket,
+            'source': f'rollup_{resolution}s' if resolution else 'raw',
+            'buckets': len(rows),
+            'series': series
+        }
+
+    def close(self):
+        with self._lock:
+            if self._closed.is_set():
+                return
+            self._closed.set()
+            self._flush()
+            self._db.close()
+        atexit.unregister(self.close)